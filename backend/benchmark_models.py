@@ -0,0 +1,121 @@
+# benchmark_models.py - Compare les modèles CLIP (vitesse, mémoire, accord des distributions) sur un dossier d'images local
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import contextlib
+import subprocess
+from collections import Counter
+
+RESULT_PREFIX = "BENCHMARK_RESULT:"
+
+
+def run_tier(args):
+    """
+    Exécuté dans un sous-processus par modèle (le pic de RSS mesuré est alors celui du seul modèle).
+    Les images sont décodées avant la mesure : le débit mesuré est celui de l'encodeur CLIP et du scoring.
+    """
+    from test_slglip2 import FashionTrendColorAnalyzer
+
+    with contextlib.redirect_stdout(sys.stderr):
+        load_start = time.perf_counter()
+        analyzer = FashionTrendColorAnalyzer(args.fixture_dir, model_name=args.worker, inference_backend=args.backend, onnx_quantize=args.quantize)
+        # Le modèle CLIP (et l'encodeur ONNX) est chargé au premier usage : on le force ici pour le compter dans load_seconds
+        analyzer.onnx_encoder if args.backend == 'onnx' else analyzer.model
+        load_seconds = time.perf_counter() - load_start
+        sources = analyzer.image_paths[:args.max_images] if args.max_images else analyzer.image_paths
+        images = [(source, analyzer._load_image(source)) for source in sources]
+        images = [(source, image) for source, image in images if image is not None]
+
+        # Lot de chauffe, non compté (allocations, initialisation des noyaux)
+        analyzer._classify_fashion_items([image for _, image in images[:args.batch_size]])
+        results = []
+        start = time.perf_counter()
+        for batch_start in range(0, len(images), args.batch_size):
+            results.extend(analyzer._classify_fashion_items([image for _, image in images[batch_start:batch_start + args.batch_size]]))
+        elapsed = time.perf_counter() - start
+        analyzer.close()
+
+    return {
+        'model': args.worker,
+        'images': len(images),
+        'load_seconds': load_seconds,
+        'classify_seconds': elapsed,
+        'images_per_sec': len(images) / elapsed if elapsed > 0 else None,
+        # ru_maxrss est en Ko sous Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'top1': {os.path.basename(source): {'garment': r['garment_scores'][0][0], 'style': r['style_scores'][0][0]} for (source, _), r in zip(images, results)},
+    }
+
+
+def distribution_agreement(reference_labels, candidate_labels):
+    """1 - distance en variation totale entre deux distributions de labels (1.0 = distributions identiques)."""
+    reference_counts, candidate_counts = Counter(reference_labels), Counter(candidate_labels)
+    reference_total, candidate_total = sum(reference_counts.values()), sum(candidate_counts.values())
+    if not reference_total or not candidate_total: return None
+    labels = set(reference_counts) | set(candidate_counts)
+    return 1 - 0.5 * sum(abs(reference_counts[l] / reference_total - candidate_counts[l] / candidate_total) for l in labels)
+
+
+def compare_to_reference(reference, tier):
+    common = sorted(set(reference['top1']) & set(tier['top1']))
+    if not common: return {}
+    agreement = {}
+    for field in ('garment', 'style'):
+        reference_labels = [reference['top1'][name][field] for name in common]
+        tier_labels = [tier['top1'][name][field] for name in common]
+        agreement[f'{field}_distribution_agreement'] = distribution_agreement(reference_labels, tier_labels)
+        agreement[f'{field}_top1_agreement'] = sum(a == b for a, b in zip(reference_labels, tier_labels)) / len(common)
+    return agreement
+
+
+def main():
+    from test_slglip2 import CLIP_MODEL_NAME, CLIP_MODEL_TIERS
+
+    parser = argparse.ArgumentParser(description="Benchmark des modèles CLIP sur un dossier d'images local.")
+    parser.add_argument("fixture_dir", help="Dossier d'images de référence.")
+    parser.add_argument("--models", nargs="+", default=CLIP_MODEL_TIERS, help="Modèles CLIP à comparer.")
+    parser.add_argument("--reference", default=CLIP_MODEL_NAME, help="Modèle de référence pour l'accord des distributions.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Nombre d'images encodées ensemble par CLIP.")
+    parser.add_argument("--max_images", type=int, default=0, help="Nombre maximal d'images utilisées (0 = toutes).")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Encodeur d'images CLIP.")
+    parser.add_argument("--quantize", action="store_true", help="Avec --backend onnx : encodeur quantifié en int8.")
+    parser.add_argument("--output", default="benchmark_models.json", help="Fichier JSON des résultats.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(f"{RESULT_PREFIX}{json.dumps(run_tier(args))}", flush=True)
+        return
+
+    models = list(dict.fromkeys(args.models + [args.reference]))
+    tiers = {}
+    for model in models:
+        print(f"--- Benchmark du modèle {model} ---", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), args.fixture_dir, "--worker", model, "--batch_size", str(args.batch_size), "--max_images", str(args.max_images), "--backend", args.backend]
+        if args.quantize: command.append("--quantize")
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        result_lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if completed.returncode != 0 or not result_lines:
+            print(f"ERREUR : le benchmark du modèle {model} a échoué (code {completed.returncode}).", file=sys.stderr)
+            continue
+        tiers[model] = json.loads(result_lines[-1][len(RESULT_PREFIX):])
+
+    reference = tiers.get(args.reference)
+    report = {'fixture_dir': os.path.abspath(args.fixture_dir), 'reference': args.reference, 'backend': args.backend, 'quantize': args.quantize, 'tiers': []}
+    for model in models:
+        if model not in tiers: continue
+        tier = {k: v for k, v in tiers[model].items() if k != 'top1'}
+        if reference is not None: tier.update(compare_to_reference(reference, tiers[model]))
+        report['tiers'].append(tier)
+        print(f"{model:>16} : {tier['images_per_sec'] or 0:7.2f} images/s, pic RSS {tier['peak_rss_mb']:8.0f} Mo, accord vêtements {tier.get('garment_distribution_agreement')}, styles {tier.get('style_distribution_agreement')}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
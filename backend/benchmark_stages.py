@@ -0,0 +1,215 @@
+# benchmark_stages.py - Mesure hors ligne (sans S3) du temps de chaque étape de l'analyse, à plusieurs tailles de collection
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import contextlib
+import subprocess
+from collections import Counter
+import numpy as np
+from PIL import Image, ImageDraw
+
+STAGES = ['decode', 'clip', 'rembg', 'kmeans', 'pantone', 'aggregation', 'json_export', 'plotting']
+# Dépendances lourdes qui ne doivent pas être importées au démarrage du script d'analyse
+HEAVY_MODULES = ['torch', 'clip', 'matplotlib', 'pandas', 'sklearn', 'skimage', 'scipy', 'rembg', 'onnxruntime', 'boto3']
+
+
+def generate_synthetic_images(output_dir, count, size=(768, 1024), seed=0):
+    """
+    Images JPEG synthétiques : un fond clair uni et quelques formes colorées au centre (« vêtements »),
+    pour que le détourage et le KMeans travaillent sur des images proches des photos de défilé.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = size
+    paths = []
+    for i in range(count):
+        background = tuple(int(c) for c in rng.integers(200, 256, 3))
+        image = Image.new('RGB', size, background)
+        draw = ImageDraw.Draw(image)
+        for _ in range(int(rng.integers(2, 6))):
+            x0, y0 = int(rng.integers(width // 5, width // 2)), int(rng.integers(height // 8, height // 2))
+            x1, y1 = int(rng.integers(width // 2, 4 * width // 5)), int(rng.integers(height // 2, 7 * height // 8))
+            fill = tuple(int(c) for c in rng.integers(0, 256, 3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)([x0, y0, x1, y1], fill=fill)
+        path = os.path.join(output_dir, f"synthetic_{i:05d}.jpg")
+        image.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_startup(runs=3):
+    """
+    Temps de démarrage de l'analyseur (meilleur de runs exécutions dans un nouveau processus) :
+    import du module et `test_slglip2.py --help`, avec la liste des dépendances lourdes chargées par l'import.
+    """
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    probe = f"import sys, json, test_slglip2; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    commands = {'import_seconds': [sys.executable, '-c', probe], 'help_seconds': [sys.executable, 'test_slglip2.py', '--help']}
+    startup = {}
+    for name, command in commands.items():
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            completed = subprocess.run(command, cwd=backend_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+            durations.append(time.perf_counter() - start)
+        startup[name] = min(durations)
+        if name == 'import_seconds': startup['heavy_modules_on_import'] = json.loads(completed.stdout.strip().splitlines()[-1])
+    return startup
+
+
+def benchmark_collection(analyzer, image_paths, work_dir, num_colors, min_cluster_size, batch_size, confidence_threshold):
+    """Exécute chaque étape sur toute la collection et retourne les durées (s) par étape."""
+    from trend_aggregator import TrendAggregator
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    extractor = analyzer.color_extractor
+
+    # Deux décodages réduits par image : à la résolution de CLIP, et borné pour l'étape couleur
+    start = time.perf_counter()
+    images_bytes = [analyzer._fetch_image_bytes(path) for path in image_paths]
+    images = [analyzer._decode_image(image_bytes, path) for image_bytes, path in zip(images_bytes, image_paths)]
+    color_images = [extractor.decode(image_bytes) for image_bytes in images_bytes]
+    timings['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analysis_results = []
+    for batch_start in range(0, len(images), batch_size):
+        analysis_results.extend(analyzer._classify_fashion_items(images[batch_start:batch_start + batch_size]))
+    timings['clip'] = time.perf_counter() - start
+
+    all_colors = []
+    for image, area_ratio in color_images:
+        start = time.perf_counter()
+        pixels = extractor.subject_pixels(image)
+        timings['rembg'] += time.perf_counter() - start
+        if len(pixels) <= num_colors:
+            all_colors.append([])
+            continue
+        start = time.perf_counter()
+        centers, cluster_sizes = extractor.cluster_pixels(pixels, num_colors)
+        timings['kmeans'] += time.perf_counter() - start
+        start = time.perf_counter()
+        all_colors.append(extractor.describe_clusters(centers, cluster_sizes, len(pixels), min_cluster_size * area_ratio))
+        timings['pantone'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    aggregator = TrendAggregator(analyzer.fashion_color_ranges, analyzer._find_best_pantone_matches, confidence_threshold)
+    for path, results, colors in zip(image_paths, analysis_results, all_colors):
+        aggregator.add_image(path, results, colors)
+    fashion_trends, all_detected_garments_with_scores = aggregator.report()
+    timings['aggregation'] = time.perf_counter() - start
+
+    if fashion_trends:
+        start = time.perf_counter()
+        analyzer.export_to_json(analyzer._transform_results_for_db(fashion_trends), os.path.join(work_dir, 'report.json'))
+        timings['json_export'] = time.perf_counter() - start
+
+        weighted_garment_counts = Counter()
+        for garment, score in all_detected_garments_with_scores:
+            weighted_garment_counts[garment] += score
+        # visualize_fashion_trends écrit ses PNG dans le dossier courant
+        start = time.perf_counter()
+        with contextlib.chdir(work_dir):
+            analyzer.visualize_fashion_trends(fashion_trends, weighted_garment_counts)
+        timings['plotting'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne, étape par étape, de l'analyseur de tendances.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 32, 128], help="Tailles de collection mesurées.")
+    parser.add_argument("--fixture_dir", help="Dossier d'images à utiliser à la place des images synthétiques (réutilisées en boucle si besoin).")
+    parser.add_argument("--model", help="Modèle CLIP (défaut : celui de l'analyseur).")
+    parser.add_argument("--color_mode", choices=["exact", "fast"], default="exact", help="Extraction des couleurs.")
+    parser.add_argument("--mask_max_side", type=int, default=512, help="Plus grand côté de l'image utilisée pour le détourage.")
+    parser.add_argument("--color_max_side", type=int, default=1024, help="Plus grand côté de l'image décodée pour l'étape couleur (0 = pleine résolution).")
+    parser.add_argument("--num_colors", type=int, default=15, help="Nombre de clusters KMeans par image.")
+    parser.add_argument("--min_cluster_size", type=int, default=100, help="Taille minimale d'un cluster gardé.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Nombre d'images encodées ensemble par CLIP.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Seuil de confiance.")
+    parser.add_argument("--startup_budget", type=float, default=1.0, help="Budget (s) du démarrage à froid de test_slglip2.py --help.")
+    parser.add_argument("--startup_only", action="store_true", help="Mesure uniquement le temps de démarrage.")
+    parser.add_argument("--output", default="benchmark_stages.json", help="Fichier JSON des résultats.")
+    args = parser.parse_args()
+
+    startup = measure_startup()
+    startup['budget_seconds'] = args.startup_budget
+    startup['within_budget'] = startup['help_seconds'] <= args.startup_budget and not startup['heavy_modules_on_import']
+    print(f"Démarrage : import {startup['import_seconds']:.2f} s, --help {startup['help_seconds']:.2f} s (budget {args.startup_budget:.2f} s), dépendances lourdes à l'import : {startup['heavy_modules_on_import'] or 'aucune'}")
+    if not startup['within_budget']:
+        print("AVERTISSEMENT : le budget de démarrage est dépassé.", file=sys.stderr)
+    if args.startup_only:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'revision': git_revision(), 'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'startup': startup}, f, ensure_ascii=False, indent=4)
+        print(f"Résultats écrits dans {args.output}")
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="fashion_benchmark_")
+    try:
+        if args.fixture_dir:
+            from test_slglip2 import LOCAL_IMAGE_EXTENSIONS
+            fixtures = sorted(os.path.join(args.fixture_dir, f) for f in os.listdir(args.fixture_dir) if f.lower().endswith(LOCAL_IMAGE_EXTENSIONS))
+            if not fixtures: parser.error(f"Aucune image dans {args.fixture_dir}.")
+            image_pool = list(itertools.islice(itertools.cycle(fixtures), max(args.sizes)))
+        else:
+            image_pool = generate_synthetic_images(os.path.join(work_dir, 'images'), max(args.sizes))
+
+        with contextlib.redirect_stdout(sys.stderr):
+            from test_slglip2 import FashionTrendColorAnalyzer
+            options = {'model_name': args.model} if args.model else {}
+            start = time.perf_counter()
+            analyzer = FashionTrendColorAnalyzer(os.path.dirname(image_pool[0]), color_mode=args.color_mode, mask_max_side=args.mask_max_side, color_max_side=args.color_max_side, **options)
+            load_seconds = time.perf_counter() - start
+            # Pas de cache de masques : chaque mesure paie le détourage
+            analyzer.color_extractor.mask_cache_dir = None
+            # Chauffe (allocations, noyaux CLIP, session rembg), non comptée
+            benchmark_collection(analyzer, image_pool[:1], work_dir, args.num_colors, args.min_cluster_size, args.batch_size, args.threshold)
+
+            results = []
+            for size in args.sizes:
+                print(f"--- Collection de {size} images ---")
+                timings = benchmark_collection(analyzer, image_pool[:size], work_dir, args.num_colors, args.min_cluster_size, args.batch_size, args.threshold)
+                total = sum(timings.values())
+                results.append({
+                    'images': size,
+                    'total_seconds': total,
+                    'images_per_sec': size / total if total > 0 else None,
+                    'stages': {stage: {'seconds': seconds, 'ms_per_image': 1000 * seconds / size, 'share': seconds / total if total > 0 else None} for stage, seconds in timings.items()},
+                })
+            analyzer.close()
+
+        import torch
+        report = {
+            'revision': git_revision(),
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': {'python': platform.python_version(), 'torch': torch.__version__, 'device': analyzer.device, 'cpu_count': os.cpu_count()},
+            'config': {'model': analyzer.model_name, 'color_mode': args.color_mode, 'mask_max_side': args.mask_max_side, 'color_max_side': args.color_max_side, 'num_colors': args.num_colors, 'batch_size': args.batch_size, 'synthetic': not args.fixture_dir},
+            'startup': startup,
+            'analyzer_init_seconds': load_seconds,
+            'collections': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        for result in results:
+            stages = ', '.join(f"{stage} {result['stages'][stage]['ms_per_image']:.1f}" for stage in STAGES)
+            print(f"{result['images']:>5} images : {result['images_per_sec'] or 0:.2f} images/s (ms/image : {stages})")
+        print(f"Résultats écrits dans {args.output}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,23 @@
 # bucket.py - Final Version
 import os
 import sys
+import argparse
+import queue
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+from html.parser import HTMLParser
+from urllib.parse import urljoin
 import requests
-import time
 import json
-from datetime import datetime
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
+from requests.adapters import HTTPAdapter
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,9 +29,101 @@ def setup_driver():
     chrome_options.add_argument('--disable-dev-shm-usage')
     return webdriver.Chrome(options=chrome_options)
 
-def upload_file_to_s3(file_name, bucket, object_name=None):
+@contextlib.contextmanager
+def single_driver():
+    driver = setup_driver()
+    try:
+        yield driver
+    finally:
+        driver.quit()
+
+class DriverPool:
+    """
+    Warm headless Chrome instances shared by scrape jobs (service mode). borrow() hands out an idle driver,
+    starting one only when none is available; at most `size` drivers exist at once. When a job is done the
+    driver is reset (storage, cookies, extra windows, blank page) and returned to the pool, unless it failed
+    or has served max_jobs_per_driver jobs: it is then quit, so browser memory growth stays bounded.
+    """
+    def __init__(self, size=2, max_jobs_per_driver=20):
+        self.size = max(1, size)
+        self.max_jobs_per_driver = max(1, max_jobs_per_driver)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._jobs_served = {}
+
+    def warm_up(self):
+        for _ in range(self.size):
+            self._idle.put(setup_driver())
+
+    @contextlib.contextmanager
+    def borrow(self):
+        self._slots.acquire()
+        driver, healthy = None, False
+        try:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = setup_driver()
+            yield driver
+            healthy = True
+        finally:
+            if driver is not None: self._give_back(driver, healthy)
+            self._slots.release()
+
+    def _give_back(self, driver, healthy):
+        jobs_served = self._jobs_served.pop(driver, 0) + 1
+        if healthy and jobs_served < self.max_jobs_per_driver and self._reset(driver):
+            self._jobs_served[driver] = jobs_served
+            self._idle.put(driver)
+            return
+        logging.info(f"Recycling Chrome driver after {jobs_served} job(s).")
+        self._quit(driver)
+
+    @staticmethod
+    def _reset(driver):
+        try:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            driver.delete_all_cookies()
+            for handle in driver.window_handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+            driver.get('about:blank')
+            return True
+        except Exception as e:
+            logging.warning(f"Chrome driver reset failed: {e}")
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Chrome driver quit failed: {e}")
+
+    def close(self):
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._jobs_served.clear()
+
+def create_http_session(pool_size):
+    # One pooled session for all downloads: connections to the image CDN are reused across images
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def create_s3_client(pool_size):
+    # boto3 clients are thread-safe: a single client (and connection pool) is shared by all upload workers
+    return boto3.client('s3', config=Config(max_pool_connections=pool_size))
+
+def upload_file_to_s3(file_name, bucket, object_name=None, s3_client=None):
     if object_name is None: object_name = os.path.basename(file_name)
-    s3_client = boto3.client('s3')
+    if s3_client is None: s3_client = boto3.client('s3')
     try:
         s3_client.upload_file(file_name, bucket, object_name)
         logging.info(f"File {file_name} uploaded to s3://{bucket}/{object_name}")
@@ -32,12 +132,42 @@ def upload_file_to_s3(file_name, bucket, object_name=None):
         logging.error(f"S3 upload failed for {file_name}: {e}")
         return False
 
-def download_image(url, output_path, index):
+def is_jpeg_response(response):
+    content_type = response.headers.get('content-type', '')
+    return 'image/jpeg' in content_type or 'image/jpg' in content_type
+
+# Memory bound of a streamed upload. The HTTP body is not seekable, so upload_fileobj buffers it: a body below
+# multipart_threshold (every normal JPEG) is read whole and sent in one PUT, a larger one is sent as parts of
+# multipart_chunksize. Without threads an upload buffers one part at a time (the default config reads up to
+# 10 parts ahead, so its peak grows with the file). Measured peak with copies: about 3 x 8 MB per upload,
+# so roughly workers x 24 MB at worst. Transfers are already parallel across images.
+STREAM_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, use_threads=False)
+
+def stream_image_to_s3(url, bucket, object_name, session=None, s3_client=None):
+    """
+    Pipes the HTTP response body straight into S3 (no temporary file). Each image is buffered in memory,
+    8 MB at a time at most (see STREAM_TRANSFER_CONFIG for the resulting bound).
+    """
+    if s3_client is None: s3_client = boto3.client('s3')
     try:
-        response = requests.get(url, timeout=20, stream=True)
+        with (session or requests).get(url, timeout=20, stream=True) as response:
+            response.raise_for_status()
+            if not is_jpeg_response(response):
+                return False
+            # Undo any Content-Encoding (gzip) so the stored object is the image itself
+            response.raw.decode_content = True
+            s3_client.upload_fileobj(response.raw, bucket, object_name, ExtraArgs={'ContentType': 'image/jpeg'}, Config=STREAM_TRANSFER_CONFIG)
+        logging.info(f"Image {url} streamed to s3://{bucket}/{object_name}")
+        return True
+    except Exception as e:
+        logging.warning(f"Failed to stream {url} to S3: {e}")
+    return False
+
+def download_image(url, output_path, index, session=None):
+    try:
+        response = (session or requests).get(url, timeout=20, stream=True)
         response.raise_for_status()
-        content_type = response.headers.get('content-type', '')
-        if 'image/jpeg' in content_type or 'image/jpg' in content_type:
+        if is_jpeg_response(response):
             os.makedirs(output_path, exist_ok=True)
             filename = os.path.join(output_path, f'image_{index}.jpg')
             with open(filename, 'wb') as f:
@@ -47,50 +177,307 @@ def download_image(url, output_path, index):
         logging.warning(f"Failed to download {url}: {e}")
     return False, None
 
-def scrape_images(url, local_temp_folder, s3_bucket_name, s3_folder_prefix, delete_local_after_upload=True):
-    os.makedirs(local_temp_folder, exist_ok=True)
-    driver = setup_driver()
+def transfer_image(session, s3_client, src, index, local_temp_folder, s3_bucket_name, s3_folder_prefix, delete_local_after_upload=True):
+    """
+    Copies one image to S3 and returns True when it ends up in the bucket. Streams it directly when
+    local_temp_folder is None; otherwise goes through a local file (debug mode).
+    """
+    if local_temp_folder is None:
+        return stream_image_to_s3(src, s3_bucket_name, f"{s3_folder_prefix}/image_{index}.jpg", session=session, s3_client=s3_client)
+    success, local_filename = download_image(src, local_temp_folder, index, session=session)
+    if not success:
+        return False
+    s3_object_name = f"{s3_folder_prefix}/{os.path.basename(local_filename)}"
+    uploaded = upload_file_to_s3(local_filename, s3_bucket_name, s3_object_name, s3_client=s3_client)
+    if uploaded and delete_local_after_upload:
+        os.remove(local_filename)
+    return uploaded
+
+def transfer_images(image_urls, local_temp_folder, s3_bucket_name, s3_folder_prefix, delete_local_after_upload=True, workers=8, session=None):
+    """
+    Downloads and uploads (index, url) pairs with a bounded pool of workers sharing one HTTP session and one S3 client.
+    A session passed by the caller is reused (and left open); otherwise one is created for the transfer.
+    Returns {'succeeded': n, 'failed': n}.
+    """
+    workers = max(1, workers)
+    owns_session = session is None
+    if owns_session: session = create_http_session(workers)
+    s3_client = create_s3_client(workers)
     try:
-        driver.get(url)
-        time.sleep(5)
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        for _ in range(10): # Scroll 10 times
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height: break
-            last_height = new_height
-        
-        img_elements = driver.find_elements(By.TAG_NAME, 'img')
-        logging.info(f"Found {len(img_elements)} image elements.")
-        
-        for index, img_element in enumerate(img_elements):
-            src = img_element.get_attribute('src')
-            if src and src.startswith('http'):
-                success, local_filename = download_image(src, local_temp_folder, index)
-                if success:
-                    s3_object_name = f"{s3_folder_prefix}/{os.path.basename(local_filename)}"
-                    if upload_file_to_s3(local_filename, s3_bucket_name, s3_object_name):
-                        if delete_local_after_upload:
-                            os.remove(local_filename)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda item: transfer_image(session, s3_client, item[1], item[0], local_temp_folder, s3_bucket_name, s3_folder_prefix, delete_local_after_upload), image_urls))
     finally:
-        driver.quit()
+        if owns_session: session.close()
+    stats = {'succeeded': sum(results), 'failed': len(results) - sum(results)}
+    logging.info(f"Transfer finished: {stats['succeeded']} image(s) uploaded, {stats['failed']} failed or skipped.")
+    return stats
 
-if __name__ == '__main__':
-    S3_BUCKET_NAME = 'trendsproject'
-    s3_folder_root = 'images/tagwalk'
-    
-    if len(sys.argv) > 1:
-        url_to_scrape = sys.argv[1]
+def count_images(driver):
+    return driver.execute_script("return document.images.length")
+
+def load_page_images(driver, url, page_timeout=20, scroll_timeout=3, max_scrolls=10):
+    """
+    Loads the page and scrolls it until it stops producing new <img> elements, with explicit waits instead
+    of fixed sleeps: each wait returns as soon as its condition holds, and scrolling stops early once a scroll
+    adds neither images nor page height within scroll_timeout seconds.
+    """
+    driver.get(url)
+    try:
+        WebDriverWait(driver, page_timeout, poll_frequency=0.25).until(lambda d: d.execute_script("return document.readyState") == 'complete' and count_images(d) > 0)
+    except TimeoutException:
+        logging.warning(f"No image appeared on {url} within {page_timeout} s.")
+        return
+    for _ in range(max_scrolls):
+        last_count, last_height = count_images(driver), driver.execute_script("return document.body.scrollHeight")
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        try:
+            WebDriverWait(driver, scroll_timeout, poll_frequency=0.25).until(lambda d: count_images(d) > last_count or d.execute_script("return document.body.scrollHeight") > last_height)
+        except TimeoutException:
+            break
+
+def parse_srcset(srcset):
+    """
+    'a.jpg 640w, b.jpg 1280w' or 'a.jpg 1x, b.jpg 2x' -> [(url, 'w' | 'x', value)].
+    URLs may contain commas (image CDN transformations): a URL runs up to the next whitespace.
+    """
+    candidates, pos, length = [], 0, len(srcset or '')
+    while pos < length:
+        while pos < length and (srcset[pos].isspace() or srcset[pos] == ','): pos += 1
+        start = pos
+        while pos < length and not srcset[pos].isspace(): pos += 1
+        url, descriptor = srcset[start:pos], ''
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            start = pos
+            while pos < length and srcset[pos] != ',': pos += 1
+            descriptor = srcset[start:pos].strip()
+        if not url: continue
+        try:
+            if descriptor.endswith('w'): candidates.append((url, 'w', int(descriptor[:-1])))
+            elif descriptor.endswith('x'): candidates.append((url, 'x', float(descriptor[:-1])))
+            elif not descriptor: candidates.append((url, 'x', 1.0))
+        except ValueError:
+            continue
+    return candidates
+
+def width_from_sizes(sizes, viewport_width=1280):
+    """
+    Slot width announced by the sizes attribute when the layout is unknown: its last entry (the one without
+    a media condition), in px or vw. Returns 0 when it cannot be read.
+    """
+    if not sizes: return 0
+    length = sizes.split(',')[-1].strip().split()[-1] if sizes.strip() else ''
+    try:
+        if length.endswith('px'): return float(length[:-2])
+        if length.endswith('vw'): return float(length[:-2]) * viewport_width / 100
+    except ValueError:
+        pass
+    return 0
+
+def select_image_url(image, base_url, target_width=768, min_rendered_side=150):
+    """
+    Picks the URL to download for one <img> described by a dict (src, srcset, sizes, width, height = rendered
+    size, 0 when unknown). Returns None for tiny or decorative images (rendered smaller than min_rendered_side),
+    otherwise the smallest srcset variant at least target_width pixels wide, the largest one when none is, or src.
+    """
+    width, height = image.get('width') or 0, image.get('height') or 0
+    if width and height and min(width, height) < min_rendered_side:
+        return None
+    candidates = parse_srcset(image.get('srcset'))
+    if not candidates:
+        src = image.get('src')
+        return urljoin(base_url, src) if src else None
+    width_candidates = [(value, url) for url, kind, value in candidates if kind == 'w']
+    if width_candidates:
+        options = width_candidates
     else:
-        url_to_scrape = 'https://www.tag-walk.com/en/collection/woman/acne-studios/spring-summer-2025'
+        # Density descriptors: pixel width = slot width x density (unknown slot: the highest density wins)
+        slot_width = width or width_from_sizes(image.get('sizes'))
+        options = [(value * (slot_width or 1), url) for url, kind, value in candidates]
+    large_enough = [option for option in options if option[0] >= target_width]
+    return urljoin(base_url, min(large_enough)[1] if large_enough else max(options)[1])
+
+def select_image_urls(images, base_url, target_width=768, min_rendered_side=150):
+    """[(index, url)] for the distinct images worth downloading, keeping the position of their first occurrence on the page."""
+    selected = [(index, select_image_url(image, base_url, target_width, min_rendered_side)) for index, image in enumerate(images)]
+    # The same file can appear several times on a page (and in its JSON payload): it is only kept once
+    first_index = {}
+    for index, src in selected:
+        if src and src.startswith('http'): first_index.setdefault(src, index)
+    selected = [(index, src) for src, index in first_index.items()]
+    logging.info(f"Selected {len(selected)} of {len(images)} images ({len(images) - len(selected)} tiny, decorative or without URL).")
+    return selected
+
+# Attributes and rendered size of every <img>, read in a single round trip (lazy loaders often use data-srcset)
+READ_IMAGES_SCRIPT = """
+return Array.from(document.images).map(img => {
+    const rect = img.getBoundingClientRect();
+    return {src: img.getAttribute('src') || img.dataset.src || '', srcset: img.getAttribute('srcset') || img.dataset.srcset || '',
+            sizes: img.getAttribute('sizes') || '', width: rect.width || img.naturalWidth, height: rect.height || img.naturalHeight};
+});
+"""
+
+def collect_image_urls_with_browser(driver, url, page_timeout=20, scroll_timeout=3, max_scrolls=10, target_width=768, min_rendered_side=150):
+    load_page_images(driver, url, page_timeout, scroll_timeout, max_scrolls)
+    images = driver.execute_script(READ_IMAGES_SCRIPT)
+    logging.info(f"Found {len(images)} image elements.")
+    return select_image_urls(images, driver.current_url, target_width, min_rendered_side)
+
+class ImageSourceParser(HTMLParser):
+    """Collects <img> attributes and the image URLs embedded in JSON <script> payloads (JSON-LD, hydration data)."""
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+        self.images = []
+        self._in_json_script = False
+
+    @staticmethod
+    def _dimension(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'img':
+            # Without a layout, the rendered size comes from the width/height attributes when present
+            self.images.append({'src': attrs.get('src') or attrs.get('data-src'), 'srcset': attrs.get('srcset') or attrs.get('data-srcset'), 'sizes': attrs.get('sizes'),
+                                'width': self._dimension(attrs.get('width')), 'height': self._dimension(attrs.get('height'))})
+        elif tag == 'script':
+            self._in_json_script = 'json' in (attrs.get('type') or '')
+
+    def handle_endtag(self, tag):
+        if tag == 'script': self._in_json_script = False
+
+    def handle_data(self, data):
+        if not self._in_json_script: return
+        try:
+            self._collect_json_urls(json.loads(data))
+        except ValueError:
+            pass
+
+    def _collect_json_urls(self, value):
+        if isinstance(value, dict):
+            for item in value.values(): self._collect_json_urls(item)
+        elif isinstance(value, list):
+            for item in value: self._collect_json_urls(item)
+        elif isinstance(value, str) and value.startswith('http') and value.lower().split('?')[0].endswith(self.IMAGE_EXTENSIONS):
+            self.images.append({'src': value})
+
+def collect_image_urls_over_http(url, session=None, target_width=768, min_rendered_side=150):
+    """HTTP-only extraction (no browser): works for pages whose images are in the server-rendered HTML or its JSON payload."""
+    response = (session or requests).get(url, timeout=20)
+    response.raise_for_status()
+    parser = ImageSourceParser(response.url)
+    parser.feed(response.text)
+    logging.info(f"Found {len(parser.images)} images over HTTP.")
+    return select_image_urls(parser.images, response.url, target_width, min_rendered_side)
+
+def scrape_images(url, local_temp_folder, s3_bucket_name, s3_folder_prefix, delete_local_after_upload=True, workers=8, http_only=False, page_timeout=20, scroll_timeout=3, max_scrolls=10, driver_pool=None, target_width=768, min_rendered_side=150, min_http_images=10):
+    # local_temp_folder=None: images are streamed from the site to S3 without touching the disk
+    if local_temp_folder is not None: os.makedirs(local_temp_folder, exist_ok=True)
+    # The page request and the image transfers share one pooled session (same host, same connections)
+    session = create_http_session(max(1, workers))
+    try:
+        image_urls = []
+        if http_only:
+            try:
+                image_urls = collect_image_urls_over_http(url, session=session, target_width=target_width, min_rendered_side=min_rendered_side)
+            except Exception as e:
+                logging.warning(f"HTTP-only extraction failed for {url}: {e}")
+            # A partial server render (placeholders, first screen only) yields a few images: the browser sees the full page
+            if len(image_urls) < min_http_images:
+                logging.info(f"Only {len(image_urls)} image(s) found without a browser (minimum {min_http_images}), falling back to Chrome.")
+                image_urls = []
+        if not image_urls:
+            # The src attributes are read while the driver is held; transfers run afterwards, in parallel
+            with (driver_pool.borrow() if driver_pool is not None else single_driver()) as driver:
+                image_urls = collect_image_urls_with_browser(driver, url, page_timeout, scroll_timeout, max_scrolls, target_width, min_rendered_side)
+        return transfer_images(image_urls, local_temp_folder, s3_bucket_name, s3_folder_prefix, delete_local_after_upload, workers, session=session)
+    finally:
+        session.close()
+
+S3_BUCKET_NAME = 'trendsproject'
+S3_FOLDER_ROOT = 'images/tagwalk'
+
+def collection_s3_prefix(url):
+    collection_name = url.rstrip('/').split('/')[-1]
+    return collection_name, f"{S3_FOLDER_ROOT}/{collection_name}"
+
+def scrape_options(args):
+    return dict(delete_local_after_upload=not args.debug_local_files, workers=args.workers, http_only=args.http_only, page_timeout=args.page_timeout, scroll_timeout=args.scroll_timeout, max_scrolls=args.max_scrolls, target_width=args.target_width, min_rendered_side=args.min_rendered_side, min_http_images=args.min_http_images)
+
+def local_folder(args, collection_name):
+    return os.path.expanduser(f'~/scraped_images_temp/{collection_name}') if args.debug_local_files else None
+
+def serve(args):
+    """
+    Service mode: a pool of warm Chrome drivers is started once, then jobs are read from stdin, one JSON
+    line each: {"job_id": ..., "url": ...}. Up to --pool_size jobs run at the same time. Each job produces
+    one JSON line on stdout: {"job_id": ..., "status": "completed", "s3_folder_path": ..., "stats": {...}}
+    or {"job_id": ..., "status": "failed", "error": ...}. Everything else goes to stderr.
+    """
+    protocol_out, reply_lock = sys.stdout, threading.Lock()
+
+    def reply(message):
+        with reply_lock:
+            protocol_out.write(json.dumps(message) + "\n")
+            protocol_out.flush()
+
+    def run(job_id, url):
+        try:
+            collection_name, s3_folder_prefix = collection_s3_prefix(url)
+            stats = scrape_images(url, local_folder(args, collection_name), S3_BUCKET_NAME, s3_folder_prefix, driver_pool=pool, **scrape_options(args))
+            reply({"job_id": job_id, "status": "completed", "s3_folder_path": f"s3://{S3_BUCKET_NAME}/{s3_folder_prefix}", "stats": stats})
+        except Exception as e:
+            logging.exception(f"Scrape job {job_id} failed")
+            reply({"job_id": job_id, "status": "failed", "error": str(e)})
+
+    with contextlib.redirect_stdout(sys.stderr):
+        pool = DriverPool(args.pool_size, args.max_jobs_per_driver)
+        try:
+            pool.warm_up()
+            reply({"status": "ready"})
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                for line in sys.stdin:
+                    if not line.strip(): continue
+                    try:
+                        job = json.loads(line)
+                        executor.submit(run, job["job_id"], job["url"])
+                    except (ValueError, KeyError) as e:
+                        reply({"job_id": None, "status": "failed", "error": f"Invalid job: {e}"})
+        finally:
+            pool.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrapes the images of a tag-walk collection page into S3.")
+    parser.add_argument("url", nargs="?", default='https://www.tag-walk.com/en/collection/woman/acne-studios/spring-summer-2025', help="Collection page to scrape.")
+    parser.add_argument("--serve", action="store_true", help="Service mode: scrape jobs read as JSON lines on stdin, with a pool of warm Chrome drivers.")
+    parser.add_argument("--pool_size", type=int, default=2, help="Service mode: number of warm Chrome drivers (and of concurrent jobs).")
+    parser.add_argument("--max_jobs_per_driver", type=int, default=20, help="Service mode: a driver is restarted after this many jobs.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent image downloads/uploads.")
+    parser.add_argument("--http_only", action="store_true", help="Extract image URLs from the page HTML/JSON without launching Chrome (falls back to Chrome if fewer than --min_http_images are found).")
+    parser.add_argument("--min_http_images", type=int, default=10, help="With --http_only: fewer images than this over HTTP means a partial page, and Chrome is used instead.")
+    parser.add_argument("--page_timeout", type=float, default=20, help="Maximum wait (s) for the first images of the page.")
+    parser.add_argument("--scroll_timeout", type=float, default=3, help="Scrolling stops when a scroll adds no image within this delay (s).")
+    parser.add_argument("--max_scrolls", type=int, default=10, help="Maximum number of scrolls.")
+    parser.add_argument("--target_width", type=int, default=768, help="Smallest image width (px) wanted from srcset: the smallest variant at least this wide is downloaded.")
+    parser.add_argument("--min_rendered_side", type=int, default=150, help="Images rendered smaller than this (px, shorter side) are skipped as icons, logos or thumbnails.")
+    parser.add_argument("--debug_local_files", action="store_true", help="Write each image to ~/scraped_images_temp/<collection> before uploading it, and keep the files.")
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        sys.exit(0)
+    url_to_scrape = args.url
     
     # Create dynamic S3 prefix and local folder
-    collection_name = url_to_scrape.split('/')[-1] or url_to_scrape.split('/')[-2]
-    s3_folder_prefix = f"{s3_folder_root}/{collection_name}"
-    local_temporary_folder = os.path.expanduser(f'~/scraped_images_temp/{collection_name}')
+    collection_name, s3_folder_prefix = collection_s3_prefix(url_to_scrape)
     
-    scrape_images(url_to_scrape, local_temporary_folder, S3_BUCKET_NAME, s3_folder_prefix)
+    scrape_images(url_to_scrape, local_folder(args, collection_name), S3_BUCKET_NAME, s3_folder_prefix, **scrape_options(args))
     
     # **CRUCIAL CHANGE**: Output the S3 path for the orchestrator
-    print(f"S3_FOLDER_PATH:s3://{S3_BUCKET_NAME}/{s3_folder_prefix}")
\ No newline at end of file
+    print(f"S3_FOLDER_PATH:s3://{S3_BUCKET_NAME}/{s3_folder_prefix}")
@@ -0,0 +1,84 @@
+# calibrate_dedup.py - Choix des seuils du dédoublonnage (dHash + similarité CLIP) sur un dossier de photos de défilé réelles
+import os
+import sys
+import json
+import argparse
+import contextlib
+import numpy as np
+
+SIMILARITIES = [0.85, 0.90, 0.93, 0.95, 0.97, 0.99]
+
+
+def pair_statistics(fixture_dir, batch_size, model_name=None):
+    """
+    Hash perceptuel et embedding CLIP de chaque image du dossier, puis distance de Hamming et similarité
+    cosinus de chaque paire d'images. Retourne (noms des images, distances, similarités) en matrices N x N.
+    """
+    from test_slglip2 import FashionTrendColorAnalyzer
+    from near_duplicates import perceptual_hash, _POPCOUNT8
+
+    with contextlib.redirect_stdout(sys.stderr):
+        analyzer = FashionTrendColorAnalyzer(fixture_dir, **({'model_name': model_name} if model_name else {}))
+        names, hashes, embeddings = [], [], []
+        for batch_start in range(0, len(analyzer.image_paths), batch_size):
+            batch = []
+            for source in analyzer.image_paths[batch_start:batch_start + batch_size]:
+                image_bytes = analyzer._fetch_image_bytes(source)
+                image = analyzer._decode_image(image_bytes, source) if image_bytes is not None else None
+                if image is None: continue
+                names.append(os.path.basename(source))
+                hashes.append(perceptual_hash(image_bytes))
+                batch.append(image)
+            if batch: embeddings.append(analyzer._encode_images(batch).float().cpu().numpy())
+        analyzer.close()
+
+    hashes = np.array(hashes, dtype=np.uint64)
+    xor = hashes[:, None] ^ hashes[None, :]
+    distances = _POPCOUNT8[xor.view(np.uint8)].reshape(len(hashes), len(hashes), 8).sum(axis=2)
+    embeddings = np.concatenate(embeddings)
+    return names, distances, embeddings @ embeddings.T
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nombre de paires d'images confondues par le dédoublonnage, pour chaque couple de seuils.")
+    parser.add_argument("fixture_dir", help="Dossier de photos de défilé réelles (une collection ou plus).")
+    parser.add_argument("--duplicates", help="Fichier JSON des vrais doublons : liste de paires [\"image_a.jpg\", \"image_b.jpg\"].")
+    parser.add_argument("--max_distance", type=int, default=8, help="Plus grand seuil de distance de Hamming évalué.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Nombre d'images encodées ensemble par CLIP.")
+    parser.add_argument("--model", help="Modèle CLIP (défaut : celui de l'analyseur).")
+    parser.add_argument("--output", default="calibrate_dedup.json", help="Fichier JSON des résultats.")
+    args = parser.parse_args()
+
+    names, distances, similarities = pair_statistics(args.fixture_dir, args.batch_size, args.model)
+    index = {name: i for i, name in enumerate(names)}
+    true_pairs = set()
+    if args.duplicates:
+        with open(args.duplicates, 'r', encoding='utf-8') as f:
+            true_pairs = {tuple(sorted((index[a], index[b]))) for a, b in json.load(f) if a in index and b in index}
+
+    upper = np.triu_indices(len(names), k=1)
+    pair_distances, pair_similarities = distances[upper], similarities[upper]
+    is_true = np.array([(i, j) in true_pairs for i, j in zip(*upper)], dtype=bool)
+    grid = []
+    for max_distance in range(args.max_distance + 1):
+        for min_similarity in [None] + SIMILARITIES:
+            flagged = pair_distances <= max_distance
+            if min_similarity is not None: flagged &= pair_similarities >= min_similarity
+            row = {'max_distance': max_distance, 'min_similarity': min_similarity, 'pairs_flagged': int(flagged.sum())}
+            if args.duplicates:
+                row['true_positives'] = int((flagged & is_true).sum())
+                row['false_positives'] = int((flagged & ~is_true).sum())
+                row['missed'] = int((~flagged & is_true).sum())
+            grid.append(row)
+
+    report = {'fixture_dir': os.path.abspath(args.fixture_dir), 'images': len(names), 'pairs': len(pair_distances), 'labelled_duplicates': len(true_pairs) if args.duplicates else None, 'grid': grid}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    for row in grid:
+        labelled = f", vrais {row['true_positives']}, faux {row['false_positives']}, manqués {row['missed']}" if args.duplicates else ""
+        print(f"distance <= {row['max_distance']:>2}, similarité >= {row['min_similarity'] or '-':>4} : {row['pairs_flagged']:>6} paires{labelled}")
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# clip_onnx.py - Encodeur d'images CLIP exécuté par ONNX Runtime (CPU), optionnellement quantifié int8
+import os
+import re
+import copy
+import numpy as np
+import torch
+import onnxruntime as ort
+
+
+def export_image_encoder(load_model, model_name, output_dir, quantize=False):
+    """
+    Exporte load_model().visual en ONNX (batch dynamique) dans output_dir et retourne le chemin du modèle.
+    Avec quantize, les poids sont quantifiés en int8 (quantification dynamique d'ONNX Runtime).
+    Les fichiers déjà exportés sont réutilisés : load_model (qui charge le modèle CLIP PyTorch complet)
+    n'est appelé que si l'export float32 manque.
+    """
+    safe_model_name = re.sub(r'[^A-Za-z0-9]+', '-', model_name).strip('-')
+    fp32_path = os.path.join(output_dir, f"{safe_model_name}_visual.onnx")
+    int8_path = os.path.join(output_dir, f"{safe_model_name}_visual_int8.onnx")
+
+    if quantize and os.path.exists(int8_path):
+        return int8_path
+    if not os.path.exists(fp32_path):
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"Export ONNX de l'encodeur d'images {model_name}...")
+        # Export en float32 sur CPU, quel que soit le device du modèle chargé
+        visual = copy.deepcopy(load_model().visual).float().cpu().eval()
+        resolution = visual.input_resolution
+        dummy_input = torch.randn(1, 3, resolution, resolution)
+        tmp_path = f"{fp32_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(visual, dummy_input, tmp_path, input_names=['pixel_values'], output_names=['image_embeds'],
+                              dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}}, opset_version=17)
+        os.replace(tmp_path, fp32_path)
+
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Quantification int8 de {fp32_path}...")
+        tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+class OnnxImageEncoder:
+    """
+    Remplace model.encode_image : même entrée (tenseur prétraité N x 3 x H x W), mêmes embeddings.
+    load_model n'est appelé que pour un premier export (voir export_image_encoder).
+    """
+    def __init__(self, load_model, model_name, output_dir, quantize=False):
+        self.quantize = quantize
+        self.model_path = export_image_encoder(load_model, model_name, output_dir, quantize)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        # Seul l'axe du batch est dynamique : la résolution d'entrée est fixée dans le graphe exporté
+        self.input_resolution = int(self.session.get_inputs()[0].shape[-1])
+
+    def encode_image(self, image_input):
+        outputs = self.session.run(['image_embeds'], {'pixel_values': image_input.detach().cpu().float().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def top1_agreement(reference_results, candidate_results):
+    """Part des images dont le vêtement et le style top-1 sont identiques entre deux backends."""
+    if not reference_results:
+        return {'images': 0, 'garment_top1_agreement': None, 'style_top1_agreement': None, 'mean_top1_score_drift': None}
+    garment_matches = sum(ref['garment_scores'][0][0] == cand['garment_scores'][0][0] for ref, cand in zip(reference_results, candidate_results))
+    style_matches = sum(ref['style_scores'][0][0] == cand['style_scores'][0][0] for ref, cand in zip(reference_results, candidate_results))
+    score_drift = [abs(ref['garment_scores'][0][1] - dict(cand['garment_scores'])[ref['garment_scores'][0][0]]) for ref, cand in zip(reference_results, candidate_results)]
+    return {
+        'images': len(reference_results),
+        'garment_top1_agreement': garment_matches / len(reference_results),
+        'style_top1_agreement': style_matches / len(reference_results),
+        'mean_top1_score_drift': float(np.mean(score_drift)),
+    }
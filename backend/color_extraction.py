@@ -0,0 +1,223 @@
+# color_extraction.py - Étape couleur de l'analyse (détourage, KMeans, correspondance Pantone)
+import os
+import sys
+import time
+import colorsys
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+# Session rembg propre à chaque processus (partagée par tous les extracteurs du processus)
+_REMBG_SESSION = None
+# Extracteur installé dans chaque processus du pool par _init_color_worker
+_WORKER_EXTRACTOR = None
+
+
+def _get_rembg_session():
+    global _REMBG_SESSION
+    if _REMBG_SESSION is None:
+        # rembg (et onnxruntime) n'est importé qu'au premier détourage
+        from rembg import new_session
+        _REMBG_SESSION = new_session('u2net')
+    return _REMBG_SESSION
+
+
+def match_pantone(pantone_library, rgb_colors):
+    """Couleur Pantone la plus proche (nom, hex) de chaque couleur RGB, en une requête vectorisée."""
+    if not pantone_library:
+        return [("Custom", f"#{int(c[0]):02x}{int(c[1]):02x}{int(c[2]):02x}") for c in rgb_colors]
+    return pantone_library.match_many(rgb_colors)
+
+
+class ColorExtractor:
+    """
+    Extrait les clusters de couleurs du sujet d'une image.
+    Ne dépend ni de torch ni de CLIP : l'objet est picklable et peut être envoyé
+    une seule fois à chaque processus d'un ProcessPoolExecutor (voir _init_color_worker).
+    """
+    def __init__(self, pantone_library, color_mode='exact', pixel_budget=50000, mask_max_side=512, mask_cache_dir=None, max_side=1024):
+        # 'exact' : KMeans sur tous les pixels ; 'fast' : échantillon de pixel_budget pixels + MiniBatchKMeans
+        if color_mode not in ('exact', 'fast'):
+            raise ValueError(f"Mode d'extraction des couleurs inconnu : {color_mode}")
+        self.pantone_library = pantone_library
+        self.color_mode = color_mode
+        self.pixel_budget = max(1, int(pixel_budget))
+        # Masque calculé sur une copie dont le plus grand côté vaut au plus mask_max_side (0 = pleine résolution)
+        self.mask_max_side = max(0, int(mask_max_side))
+        self.mask_cache_dir = mask_cache_dir
+        self.mask_cache = {}
+        # Plus grand côté de l'image décodée pour l'étape couleur (0 = pleine résolution)
+        self.max_side = max(0, int(max_side))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['mask_cache'] = {}
+        return state
+
+    def cache_params(self):
+        """Paramètres d'extraction qui doivent faire partie de la clé du cache d'analyse."""
+        params = {'color_mode': 'fast', 'pixel_budget': self.pixel_budget} if self.color_mode == 'fast' else {}
+        if self.mask_max_side: params['mask_max_side'] = self.mask_max_side
+        if self.max_side: params['color_max_side'] = self.max_side
+        return params
+
+    def decode(self, image_bytes):
+        """
+        Décode l'image pour l'étape couleur, en limitant son plus grand côté à max_side. Les JPEG sont décodés
+        directement à échelle réduite (draft : 1/2, 1/4 ou 1/8) puis ramenés à la taille cible, sans passer
+        par le buffer pleine résolution.
+        Retourne (image, rapport de surface image décodée / image d'origine).
+        """
+        image = Image.open(BytesIO(image_bytes))
+        full_width, full_height = image.size
+        if self.max_side and max(full_width, full_height) > self.max_side:
+            scale = self.max_side / max(full_width, full_height)
+            image.draft('RGB', (int(full_width * scale), int(full_height * scale)))
+            image = image.convert('RGB')
+            image.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+        else:
+            image = image.convert('RGB')
+        return image, (image.width * image.height) / (full_width * full_height)
+
+    def extract_from_bytes(self, image_bytes, num_colors, min_cluster_size, digest=None, stats=None):
+        """Décode l'image à résolution réduite puis en extrait les couleurs (voir extract)."""
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        image, area_ratio = self.decode(image_bytes)
+        stats['decode_seconds'] = time.perf_counter() - start
+        # min_cluster_size est exprimé en pixels de l'image d'origine : on le ramène à l'image décodée
+        return self.extract(image, num_colors, min_cluster_size * area_ratio, digest, stats)
+
+    def isolate_subject(self, image_pil, digest=None):
+        try:
+            mask = self.subject_mask(image_pil, digest)
+            image_rgba = image_pil.convert('RGBA')
+            # Même découpe que rembg.remove : les pixels hors sujet deviennent transparents
+            return Image.composite(image_rgba, Image.new('RGBA', image_rgba.size, 0), mask)
+        except Exception as e:
+            print(f"Could not remove background: {e}. Using original image.")
+            return image_pil.convert('RGBA')
+
+    def subject_mask(self, image_pil, digest=None):
+        """
+        Retourne le masque alpha (mode 'L', taille de l'image) du sujet.
+        Le masque est calculé sur une copie réduite puis ré-agrandi, et mis en cache par hash d'image
+        (en mémoire et sur disque).
+        """
+        mask_path = os.path.join(self.mask_cache_dir, f"{digest}_{self.mask_max_side}.png") if digest and self.mask_cache_dir else None
+        mask = self.mask_cache.get(mask_path) if mask_path else None
+        if mask is None and mask_path and os.path.exists(mask_path):
+            try:
+                mask = Image.open(mask_path).convert('L')
+            except OSError:
+                mask = None
+
+        if mask is None:
+            small = image_pil.convert('RGB')
+            if self.mask_max_side and max(small.size) > self.mask_max_side:
+                small = small.copy()
+                small.thumbnail((self.mask_max_side, self.mask_max_side), Image.BILINEAR)
+            session = _get_rembg_session()
+            from rembg import remove
+            mask = remove(small, session=session, only_mask=True).convert('L')
+            if mask_path:
+                try:
+                    os.makedirs(os.path.dirname(mask_path), exist_ok=True)
+                    mask.save(mask_path)
+                except OSError as e:
+                    print(f"AVERTISSEMENT : impossible d'écrire le masque {mask_path} : {e}")
+
+        if mask_path:
+            # Petit cache mémoire borné (les masques réduits pèsent quelques centaines de Ko)
+            if len(self.mask_cache) >= 256: self.mask_cache.pop(next(iter(self.mask_cache)))
+            self.mask_cache[mask_path] = mask
+        return mask if mask.size == image_pil.size else mask.resize(image_pil.size, Image.BILINEAR)
+
+    def sample_pixels(self, pixels, pixel_budget):
+        """
+        Sous-échantillonnage stratifié : les pixels (en ordre raster) sont découpés en pixel_budget
+        tranches égales et un pixel est tiré dans chacune, ce qui couvre toute la surface du sujet.
+        """
+        if len(pixels) <= pixel_budget: return pixels
+        step = len(pixels) / pixel_budget
+        rng = np.random.default_rng(0)
+        sample_idx = (np.arange(pixel_budget) * step + rng.uniform(0, step, pixel_budget)).astype(np.int64)
+        return pixels[np.minimum(sample_idx, len(pixels) - 1)]
+
+    def extract(self, image_original, num_colors, min_cluster_size, digest=None, stats=None):
+        """
+        Isole le sujet puis extrait les clusters de couleurs (KMeans) d'une image.
+        Si stats (dict) est fourni, il reçoit les durées des sous-étapes et les nombres de pixels.
+        """
+        stats = {} if stats is None else stats
+        stats['image_pixels'] = image_original.width * image_original.height
+        start = time.perf_counter()
+        pixels = self.subject_pixels(image_original, digest)
+        stats['rembg_seconds'] = time.perf_counter() - start
+        stats['subject_pixels'] = len(pixels)
+        if len(pixels) <= num_colors: return []
+        start = time.perf_counter()
+        centers, cluster_sizes = self.cluster_pixels(pixels, num_colors)
+        stats['kmeans_seconds'] = time.perf_counter() - start
+        stats['clustered_pixels'] = min(len(pixels), self.pixel_budget) if self.color_mode == 'fast' else len(pixels)
+        start = time.perf_counter()
+        image_colors = self.describe_clusters(centers, cluster_sizes, len(pixels), min_cluster_size)
+        stats['pantone_seconds'] = time.perf_counter() - start
+        return image_colors
+
+    def subject_pixels(self, image_original, digest=None):
+        """Pixels RGB (N x 3) du sujet détouré : les pixels quasi transparents sont écartés."""
+        image_subject_only = self.isolate_subject(image_original, digest)
+        img_array = np.array(image_subject_only)
+
+        if img_array.shape[2] == 4:
+            pixels_with_alpha = img_array.reshape(-1, 4)
+            return pixels_with_alpha[pixels_with_alpha[:, 3] > 50][:, :3]
+        return img_array.reshape(-1, 3)
+
+    def cluster_pixels(self, pixels, num_colors):
+        """Retourne (centres des clusters, tailles des clusters ramenées à l'échelle de tous les pixels)."""
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+        if self.color_mode == 'fast':
+            sample = self.sample_pixels(pixels, self.pixel_budget)
+            kmeans = MiniBatchKMeans(n_clusters=num_colors, batch_size=4096, random_state=0).fit(sample)
+        else:
+            sample = pixels
+            kmeans = KMeans(n_clusters=num_colors, n_init='auto', random_state=0).fit(pixels)
+        # Tailles de clusters ramenées à l'échelle de l'image complète (identiques en mode exact)
+        cluster_sizes = np.bincount(kmeans.labels_, minlength=len(kmeans.cluster_centers_)) * (len(pixels) / len(sample))
+        return kmeans.cluster_centers_, cluster_sizes
+
+    def describe_clusters(self, centers, cluster_sizes, n_pixels, min_cluster_size):
+        """Garde les clusters d'au moins min_cluster_size pixels et les décrit (HSV, Pantone, proportion)."""
+        image_colors = []
+        kept = [i_color for i_color in range(len(centers)) if cluster_sizes[i_color] >= min_cluster_size]
+        pantone_matches = match_pantone(self.pantone_library, centers[kept])
+        for i_color, (pantone_name, hex_color) in zip(kept, pantone_matches):
+            color = centers[i_color]
+            r, g, b = color
+            h, s, v = colorsys.rgb_to_hsv(r/255.0, g/255.0, b/255.0)
+            color_obj = {'rgb': color.tolist(), 'hex': hex_color, 'hue': h * 360, 'saturation': s * 100, 'value': v * 100, 'brightness': np.mean(color), 'color_complexity': np.std(color), 'proportion': cluster_sizes[i_color] / n_pixels, 'pantone_ref': pantone_name, 'color_name': pantone_name}
+            image_colors.append(color_obj)
+        return image_colors
+
+def _init_color_worker(extractor):
+    """
+    Initialiseur du ProcessPoolExecutor : installe l'extracteur (envoyé une fois par processus).
+    La sortie standard du processus est redirigée vers stderr : en mode service, stdout est le canal
+    JSON lines lu par Node.js, qu'un print ou un avertissement de rembg, onnxruntime ou sklearn corromprait.
+    """
+    global _WORKER_EXTRACTOR
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    _WORKER_EXTRACTOR = extractor
+
+
+def extract_colors_from_bytes(image_bytes, num_colors, min_cluster_size, digest=None):
+    """
+    Tâche exécutée dans un processus du pool : décode l'image puis en extrait les couleurs.
+    Retourne (couleurs, stats) ; les stats sont remontées dans les métriques du processus principal.
+    """
+    stats = {}
+    return _WORKER_EXTRACTOR.extract_from_bytes(image_bytes, num_colors, min_cluster_size, digest, stats), stats
@@ -17,6 +17,8 @@ const s3 = new AWS.S3({
 // POST /api/analysis/start
 exports.startAnalysis = async (req, res) => {
   const { sourceType, sourceInput } = req.body;
+  // Rapport compact (détail par image en Parquet sur S3) : demandé par la requête ou activé par défaut via l'environnement
+  const compact = req.body.compact ?? process.env.ANALYZER_COMPACT_REPORTS === '1';
   const userId = req.user.uid;
 
   try {
@@ -34,7 +36,7 @@ exports.startAnalysis = async (req, res) => {
     });
 
     // Lancer le long processus en arrière-plan sans attendre la fin
-    runFullAnalysisProcess(jobId, sourceType, sourceInput);
+    runFullAnalysisProcess(jobId, sourceType, sourceInput, { compact: Boolean(compact) });
 
   } catch (error) {
     res.status(500).json({ message: "Erreur lors de la création de la tâche d'analyse.", error: error.message });
@@ -131,74 +133,287 @@ async function handleBackgroundError(jobId, error) {
     await AnalysisJob.findByIdAndUpdate(jobId, { status: 'failed', completedAt: new Date(), error: errorMessage });
 }
 
-async function runFullAnalysisProcess(jobId, sourceType, sourceInput) {
+async function runFullAnalysisProcess(jobId, sourceType, sourceInput, options = {}) {
+  // Écritures de progression chaînées : chacune attend la précédente, et aucune n'est lancée
+  // une fois la tâche terminée (sinon un partialResult pourrait réapparaître après le $unset final)
+  let progressWrites = Promise.resolve();
+  let finished = false;
+  const finishProgress = async () => {
+    finished = true;
+    await progressWrites;
+  };
+
   try {
     await AnalysisJob.findByIdAndUpdate(jobId, { status: 'processing', processingStartedAt: new Date() });
 
-    const scraperScript = sourceType === 'instagram' ? 'scrap_posts_instagram.py' : 'bucket.py';
-    const scraperScriptPath = path.join(__dirname, '..', scraperScript);
+    const analysisSourcePath = await runScraper(sourceType, sourceInput);
+
+    // Résultats partiels : le front peut afficher les premières tendances via /status/:jobId
+    const onProgress = ({ progress, partial_result }) => {
+      if (finished) return;
+      progressWrites = progressWrites
+        .then(() => finished ? null : AnalysisJob.findByIdAndUpdate(jobId, { progress, partialResult: partial_result }))
+        .catch((error) => console.error(`Mise à jour de la progression impossible pour ${jobId}:`, error));
+    };
+
+    const reportPath = await runAnalysis(jobId, analysisSourcePath, onProgress, options);
+    const reportData = JSON.parse(fs.readFileSync(reportPath, 'utf-8'));
+    await finishProgress();
+
+    await AnalysisJob.findByIdAndUpdate(jobId, {
+      status: 'completed',
+      completedAt: new Date(),
+      progress: 100,
+      result: reportData,
+      $unset: { partialResult: 1 }
+    });
 
+    fs.unlinkSync(reportPath);
+    console.log(`Tâche ${jobId} terminée et rapport enregistré.`);
+  } catch (error) {
+    await finishProgress();
+    await handleBackgroundError(jobId, error);
+  }
+}
+
+// Scraping dans un processus dédié : imprime S3_FOLDER_PATH ou JSON_FILE_PATH sur stdout
+function runScraperInChildProcess(scraperScript, sourceInput) {
+  return new Promise((resolve, reject) => {
+    const scraperScriptPath = path.join(__dirname, '..', scraperScript);
     const scraperProcess = spawn('python3', [scraperScriptPath, sourceInput]);
     let scraperOutput = '', scraperError = '';
     scraperProcess.stdout.on('data', (data) => scraperOutput += data.toString());
     scraperProcess.stderr.on('data', (data) => scraperError += data.toString());
-    
-    scraperProcess.on('close', async (code) => {
+
+    scraperProcess.on('close', (code) => {
+      if (code !== 0) {
+        return reject(new Error(`Le script de scraping a échoué. Erreur: ${scraperError}`));
+      }
+      const match = scraperOutput.match(/(S3_FOLDER_PATH|JSON_FILE_PATH):(.*)/);
+      if (!match || !match[2]) {
+        return reject(new Error("Chemin de sortie du scraping non trouvé."));
+      }
+      resolve(match[2].trim());
+    });
+  });
+}
+
+// ==============================================================================
+// SECTION 3 : SERVICE D'ANALYSE RÉSIDENT
+// ==============================================================================
+// Le modèle CLIP et la bibliothèque Pantone sont chargés une seule fois par un processus Python
+// persistant (test_slglip2.py --serve) qui reçoit les tâches en JSON lines sur stdin.
+// ANALYZER_MODE=spawn rétablit l'ancien comportement (un processus par tâche).
+
+const analysisScriptPath = path.join(__dirname, '..', 'test_slglip2.py');
+// Délai maximal sans aucun message du service (progression comprise) pendant qu'une tâche est en cours
+const ANALYZER_REPLY_TIMEOUT_MS = Number(process.env.ANALYZER_REPLY_TIMEOUT_MS) || 10 * 60 * 1000;
+let analyzerService = null;
+
+function getAnalyzerService() {
+  if (analyzerService) return analyzerService;
+
+  const serviceProcess = spawn('python3', [analysisScriptPath, '--serve']);
+  const pendingJobs = new Map();
+  let stdoutBuffer = '';
+  let replyTimer = null;
+
+  // Les tâches en cours échouent et le processus est arrêté : la tâche suivante démarre un nouveau service
+  const stopService = (reason) => {
+    if (analyzerService === service) analyzerService = null;
+    clearTimeout(replyTimer);
+    for (const job of pendingJobs.values()) job.reject(new Error(reason));
+    pendingJobs.clear();
+    if (serviceProcess.exitCode === null && !serviceProcess.killed) serviceProcess.kill();
+  };
+
+  // Réarmé à chaque message : un service muet trop longtemps est considéré comme bloqué
+  const armReplyTimer = () => {
+    clearTimeout(replyTimer);
+    if (pendingJobs.size === 0) return;
+    replyTimer = setTimeout(() => stopService(`Le service d'analyse n'a pas répondu depuis ${ANALYZER_REPLY_TIMEOUT_MS / 1000} s.`), ANALYZER_REPLY_TIMEOUT_MS);
+  };
+
+  serviceProcess.stdout.on('data', (data) => {
+    stdoutBuffer += data.toString();
+    let newlineIndex;
+    while ((newlineIndex = stdoutBuffer.indexOf('\n')) >= 0) {
+      const line = stdoutBuffer.slice(0, newlineIndex).trim();
+      stdoutBuffer = stdoutBuffer.slice(newlineIndex + 1);
+      if (!line) continue;
+
+      let message;
       try {
-        if (code !== 0) {
-          throw new Error(`Le script de scraping a échoué. Erreur: ${scraperError}`);
-        }
+        message = JSON.parse(line);
+      } catch (e) {
+        // Le canal est corrompu : impossible de savoir quelle réponse a été perdue
+        stopService(`Réponse invalide du service d'analyse : ${line.slice(0, 200)}`);
+        return;
+      }
+      armReplyTimer();
+      const job = pendingJobs.get(String(message.job_id));
+      if (!job) continue;
+      if (message.status === 'progress') {
+        if (job.onProgress) job.onProgress(message);
+        continue;
+      }
+      pendingJobs.delete(String(message.job_id));
+      armReplyTimer();
+      if (message.status === 'completed') job.resolve(message.report_file_path);
+      else job.reject(new Error(`Le script d'analyse a échoué. Erreur: ${message.error}`));
+    }
+  });
+  // Les journaux du service (progression, erreurs) sont relayés tels quels
+  serviceProcess.stderr.on('data', (data) => process.stderr.write(data));
+  serviceProcess.on('error', (error) => stopService(`Le service d'analyse n'a pas pu démarrer : ${error.message}`));
+  serviceProcess.on('close', (code) => stopService(`Le service d'analyse s'est arrêté (code ${code}).`));
+  serviceProcess.stdin.on('error', (error) => stopService(`Écriture impossible vers le service d'analyse : ${error.message}`));
+
+  const service = {
+    submit(jobId, sourcePath, onProgress, options = {}) {
+      return new Promise((resolve, reject) => {
+        pendingJobs.set(String(jobId), { resolve, reject, onProgress });
+        armReplyTimer();
+        serviceProcess.stdin.write(JSON.stringify({ job_id: String(jobId), source: sourcePath, compact: Boolean(options.compact) }) + '\n');
+      });
+    },
+  };
+  analyzerService = service;
+  return service;
+}
 
-        const match = scraperOutput.match(/(S3_FOLDER_PATH|JSON_FILE_PATH):(.*)/);
-        if (!match || !match[2]) {
-          throw new Error("Chemin de sortie du scraping non trouvé.");
+// Ancien mode : un processus Python par tâche, qui imprime PROGRESS:<json> puis REPORT_FILE_PATH sur stdout
+function runAnalysisInChildProcess(jobId, sourcePath, onProgress, options = {}) {
+  return new Promise((resolve, reject) => {
+    const analysisProcess = spawn('python3', [
+      analysisScriptPath,
+      sourcePath,
+      '--job_id', jobId,
+      ...(options.compact ? ['--compact'] : [])
+    ]);
+
+    let analysisOutput = '', analysisError = '', progressBuffer = '';
+    analysisProcess.stdout.on('data', (data) => {
+      analysisOutput += data.toString();
+      progressBuffer += data.toString();
+      const lines = progressBuffer.split('\n');
+      progressBuffer = lines.pop();
+      for (const line of lines) {
+        if (!line.startsWith('PROGRESS:') || !onProgress) continue;
+        try {
+          onProgress(JSON.parse(line.slice('PROGRESS:'.length)));
+        } catch (e) {
+          // Ligne de progression tronquée ou invalide : ignorée
         }
-        const analysisSourcePath = match[2].trim();
-        
-        const analysisScriptPath = path.join(__dirname, '..', 'test_slglip2.py');
-        const analysisProcess = spawn('python3', [
-          analysisScriptPath, 
-          analysisSourcePath, 
-          '--job_id', jobId
-        ]);
-        
-        let analysisOutput = '', analysisError = '';
-        analysisProcess.stdout.on('data', (data) => analysisOutput += data.toString());
-        analysisProcess.stderr.on('data', (data) => analysisError += data.toString());
-
-        analysisProcess.on('close', async (analysisCode) => {
-          try {
-            if (analysisCode !== 0) {
-              throw new Error(`Le script d'analyse a échoué. Erreur: ${analysisError}`);
-            }
-            
-            const reportMatch = analysisOutput.match(/REPORT_FILE_PATH:(.*)/);
-            if (!reportMatch || !reportMatch[1]) {
-              throw new Error("Le chemin du rapport final n'a pas été trouvé dans la sortie du script d'analyse.");
-            }
-            
-            const reportPath = reportMatch[1].trim();
-            const reportData = JSON.parse(fs.readFileSync(reportPath, 'utf-8'));
-            
-            await AnalysisJob.findByIdAndUpdate(jobId, {
-              status: 'completed',
-              completedAt: new Date(),
-              result: reportData
-            });
-
-            fs.unlinkSync(reportPath);
-            console.log(`Tâche ${jobId} terminée et rapport enregistré.`);
-          } catch (error) {
-            await handleBackgroundError(jobId, error);
-          }
-        });
-      } catch (error) {
-        await handleBackgroundError(jobId, error);
       }
     });
-  } catch (error) {
-    await handleBackgroundError(jobId, error);
-  }
+    analysisProcess.stderr.on('data', (data) => analysisError += data.toString());
+
+    analysisProcess.on('close', (analysisCode) => {
+      if (analysisCode !== 0) {
+        return reject(new Error(`Le script d'analyse a échoué. Erreur: ${analysisError}`));
+      }
+
+      const reportMatch = analysisOutput.match(/REPORT_FILE_PATH:(.*)/);
+      if (!reportMatch || !reportMatch[1]) {
+        return reject(new Error("Le chemin du rapport final n'a pas été trouvé dans la sortie du script d'analyse."));
+      }
+      resolve(reportMatch[1].trim());
+    });
+  });
+}
+
+// Retourne le chemin du rapport JSON produit pour la tâche
+function runAnalysis(jobId, sourcePath, onProgress, options = {}) {
+  if (process.env.ANALYZER_MODE === 'spawn') return runAnalysisInChildProcess(jobId, sourcePath, onProgress, options);
+  return getAnalyzerService().submit(jobId, sourcePath, onProgress, options);
+}
+
+// ==============================================================================
+// SECTION 4 : SERVICE DE SCRAPING RÉSIDENT
+// ==============================================================================
+// bucket.py --serve garde un pool de Chrome headless déjà démarrés entre les tâches tag-walk.
+// SCRAPER_MODE=spawn rétablit l'ancien comportement (un processus et un navigateur par tâche).
+
+const scraperScriptPath = path.join(__dirname, '..', 'bucket.py');
+// Délai maximal sans aucun message du service pendant qu'une tâche est en cours (ex. Chrome bloqué)
+const SCRAPER_REPLY_TIMEOUT_MS = Number(process.env.SCRAPER_REPLY_TIMEOUT_MS) || 10 * 60 * 1000;
+let scraperService = null;
+let scrapeJobCounter = 0;
+
+function getScraperService() {
+  if (scraperService) return scraperService;
+
+  const serviceProcess = spawn('python3', [scraperScriptPath, '--serve']);
+  const pendingJobs = new Map();
+  let stdoutBuffer = '';
+  let replyTimer = null;
+
+  // Les tâches en cours échouent et le processus est arrêté (avec ses navigateurs) : la tâche suivante démarre un nouveau service
+  const stopService = (reason) => {
+    if (scraperService === service) scraperService = null;
+    clearTimeout(replyTimer);
+    for (const job of pendingJobs.values()) job.reject(new Error(reason));
+    pendingJobs.clear();
+    if (serviceProcess.exitCode === null && !serviceProcess.killed) serviceProcess.kill();
+  };
+
+  // Réarmé à chaque message : un service muet trop longtemps est considéré comme bloqué
+  const armReplyTimer = () => {
+    clearTimeout(replyTimer);
+    if (pendingJobs.size === 0) return;
+    replyTimer = setTimeout(() => stopService(`Le service de scraping n'a pas répondu depuis ${SCRAPER_REPLY_TIMEOUT_MS / 1000} s.`), SCRAPER_REPLY_TIMEOUT_MS);
+  };
+
+  serviceProcess.stdout.on('data', (data) => {
+    stdoutBuffer += data.toString();
+    let newlineIndex;
+    while ((newlineIndex = stdoutBuffer.indexOf('\n')) >= 0) {
+      const line = stdoutBuffer.slice(0, newlineIndex).trim();
+      stdoutBuffer = stdoutBuffer.slice(newlineIndex + 1);
+      if (!line) continue;
+
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (e) {
+        // Le canal est corrompu : impossible de savoir quelle réponse a été perdue
+        stopService(`Réponse invalide du service de scraping : ${line.slice(0, 200)}`);
+        return;
+      }
+      armReplyTimer();
+      const job = pendingJobs.get(String(message.job_id));
+      if (!job) continue;
+      pendingJobs.delete(String(message.job_id));
+      armReplyTimer();
+      if (message.status === 'completed') job.resolve(message.s3_folder_path);
+      else job.reject(new Error(`Le script de scraping a échoué. Erreur: ${message.error}`));
+    }
+  });
+  serviceProcess.stderr.on('data', (data) => process.stderr.write(data));
+  serviceProcess.on('error', (error) => stopService(`Le service de scraping n'a pas pu démarrer : ${error.message}`));
+  serviceProcess.on('close', (code) => stopService(`Le service de scraping s'est arrêté (code ${code}).`));
+  serviceProcess.stdin.on('error', (error) => stopService(`Écriture impossible vers le service de scraping : ${error.message}`));
+
+  const service = {
+    submit(url) {
+      return new Promise((resolve, reject) => {
+        const jobId = String(++scrapeJobCounter);
+        pendingJobs.set(jobId, { resolve, reject });
+        armReplyTimer();
+        serviceProcess.stdin.write(JSON.stringify({ job_id: jobId, url }) + '\n');
+      });
+    },
+  };
+  scraperService = service;
+  return service;
+}
+
+// Retourne le chemin S3 (tag-walk) ou JSON (Instagram) à analyser
+function runScraper(sourceType, sourceInput) {
+  if (sourceType === 'instagram') return runScraperInChildProcess('scrap_posts_instagram.py', sourceInput);
+  if (process.env.SCRAPER_MODE === 'spawn') return runScraperInChildProcess('bucket.py', sourceInput);
+  return getScraperService().submit(sourceInput);
 }
 
 exports.generateCreativeImage = async (req, res) => {
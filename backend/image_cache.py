@@ -0,0 +1,119 @@
+# image_cache.py - Cache disque des analyses par image
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from numpy_json import to_native
+
+
+class ImageAnalysisCache:
+    """
+    Cache adressé par contenu des analyses d'images.
+    Chaque entrée est identifiée par le hash SHA-256 des octets de l'image ; le dossier du cache
+    dépend des paramètres de l'analyseur (modèle, num_colors, min_cluster_size, et tout
+    paramètre supplémentaire qui modifie l'extraction des couleurs).
+    Les entrées (embedding CLIP normalisé en float32 brut, clusters de couleurs en JSON) sont dans une base
+    SQLite indexée par hash : une analyse ne lit que les entrées de ses propres images et flush() n'écrit
+    que les nouvelles, quelle que soit la taille du cache. Les lectures sont possibles depuis plusieurs threads.
+    """
+    def __init__(self, cache_dir, model_name, num_colors, min_cluster_size, embedding_dim, **extra_params):
+        params = {'model': model_name, 'num_colors': num_colors, 'min_cluster_size': min_cluster_size, **extra_params}
+        params_key = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.directory = os.path.join(cache_dir, 'image_analysis', params_key)
+        self.db_path = os.path.join(self.directory, 'analysis.sqlite')
+        self.params = params
+        self.embedding_dim = int(embedding_dim)
+        self._connection = None
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @staticmethod
+    def content_hash(image_bytes):
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _db(self, create=False):
+        """
+        Connexion SQLite ouverte au premier accès (à appeler sous self._lock). Sans create, retourne None
+        tant que rien n'a été écrit dans ce dossier : une lecture ne crée jamais le cache.
+        """
+        if self._connection is None:
+            if not create and not os.path.exists(self.db_path) and not os.path.exists(os.path.join(self.directory, 'index.json')): return None
+            os.makedirs(self.directory, exist_ok=True)
+            # timeout : attente du verrou d'écriture si un autre processus écrit dans le même cache
+            connection = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS entries (digest TEXT PRIMARY KEY, embedding BLOB NOT NULL, colors TEXT NOT NULL)')
+            self._import_legacy_index(connection)
+            self._connection = connection
+        return self._connection
+
+    def _import_legacy_index(self, connection):
+        """Reprend une seule fois l'ancien format (index.json + embeddings.f32) du même dossier, puis le supprime."""
+        index_path, embeddings_path = os.path.join(self.directory, 'index.json'), os.path.join(self.directory, 'embeddings.f32')
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('entries', {})
+            embeddings = np.fromfile(embeddings_path, dtype=np.float32)
+        except (OSError, ValueError):
+            return
+        embeddings = embeddings[:len(embeddings) - len(embeddings) % self.embedding_dim].reshape(-1, self.embedding_dim)
+        rows = [(digest, embeddings[entry['row']].tobytes(), json.dumps(entry['colors'])) for digest, entry in entries.items() if entry['row'] < len(embeddings)]
+        with connection:
+            connection.executemany('INSERT OR IGNORE INTO entries VALUES (?, ?, ?)', rows)
+        for path in (index_path, embeddings_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _fetch_one(self, query, *query_params):
+        """Première ligne de la requête, ou None ; un cache absent ou illisible se comporte comme un cache vide."""
+        try:
+            connection = self._db()
+            return connection.execute(query, query_params).fetchone() if connection is not None else None
+        except (OSError, sqlite3.Error):
+            return None
+
+    def __len__(self):
+        with self._lock:
+            row = self._fetch_one('SELECT COUNT(*) FROM entries')
+            return (row[0] if row else 0) + len(self._pending)
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._pending or self._fetch_one('SELECT 1 FROM entries WHERE digest = ?', digest) is not None
+
+    def get(self, digest):
+        """Retourne (embedding, couleurs) pour un hash d'image, ou None si absent du cache."""
+        with self._lock:
+            if digest in self._pending:
+                return self._pending[digest]
+            row = self._fetch_one('SELECT embedding, colors FROM entries WHERE digest = ?', digest)
+        if row is None: return None
+        embedding = np.frombuffer(row[0], dtype=np.float32)
+        if len(embedding) != self.embedding_dim: return None
+        return embedding.copy(), json.loads(row[1])
+
+    def put(self, digest, embedding, colors):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(self.embedding_dim)
+        colors = to_native(colors)
+        with self._lock:
+            self._pending[digest] = (embedding, colors)
+
+    def flush(self):
+        """Ajoute les nouvelles entrées à la base, en une transaction (les entrées déjà présentes sont gardées)."""
+        with self._lock:
+            if not self._pending: return
+            rows = [(digest, embedding.tobytes(), json.dumps(colors)) for digest, (embedding, colors) in self._pending.items()]
+            connection = self._db(create=True)
+            with connection:
+                connection.executemany('INSERT OR IGNORE INTO entries VALUES (?, ?, ?)', rows)
+            self._pending = {}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
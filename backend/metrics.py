@@ -0,0 +1,56 @@
+# metrics.py - Mesures d'une analyse (durées par étape, compteurs), émises en JSON lines sur stderr
+import sys
+import json
+import time
+import threading
+import contextlib
+
+
+class Metrics:
+    """
+    Spans (durées nommées) et compteurs d'une analyse.
+    Chaque span terminé est émis immédiatement sur stderr, une ligne JSON {"metric": "span", ...} ;
+    summary() retourne les totaux par étape, inclus dans le rapport exporté.
+    Thread-safe : les téléchargements et décodages sont mesurés depuis le pool de préchargement.
+    """
+    def __init__(self, stream=None, emit=True):
+        self.stream = stream
+        self.emit = emit
+        self.started_at = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_duration(name, time.perf_counter() - start, **fields)
+
+    def add_duration(self, name, seconds, **fields):
+        """Enregistre une durée mesurée ailleurs (ex. dans un processus du pool couleur)."""
+        with self._lock:
+            span = self.spans.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            span['count'] += 1
+            span['total_seconds'] += seconds
+            span['max_seconds'] = max(span['max_seconds'], seconds)
+        self._emit({'metric': 'span', 'name': name, 'duration_ms': round(seconds * 1000, 3), **fields})
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _emit(self, record):
+        if not self.emit: return
+        stream = self.stream or sys.stderr
+        try:
+            stream.write(json.dumps(record, default=str) + "\n")
+        except (OSError, ValueError):
+            pass
+
+    def summary(self):
+        with self._lock:
+            stages = {name: {'count': span['count'], 'total_seconds': span['total_seconds'], 'mean_ms': 1000 * span['total_seconds'] / span['count'], 'max_ms': 1000 * span['max_seconds']} for name, span in self.spans.items()}
+            return {'wall_seconds': time.perf_counter() - self.started_at, 'stages': stages, 'counters': dict(self.counters)}
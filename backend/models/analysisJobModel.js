@@ -16,6 +16,9 @@ const analysisJobSchema = new mongoose.Schema({
   sourceType: { type: String, required: true },
   sourceInput: { type: String, required: true },
   result: { type: mongoose.Schema.Types.Mixed },
+  // Progression (%) et rapport partiel envoyés par l'analyseur pendant le traitement
+  progress: { type: Number, default: 0 },
+  partialResult: { type: mongoose.Schema.Types.Mixed },
   error: { type: String },
   createdAt: { type: Date, default: Date.now },
   processingStartedAt: { type: Date },
@@ -0,0 +1,61 @@
+# near_duplicates.py - Détection des quasi-doublons (reposts, même look à plusieurs tailles) par hash perceptuel
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+# Nombre de bits à 1 de chaque octet, pour la distance de Hamming entre hashes 64 bits
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(image_bytes):
+    """
+    dHash 64 bits : l'image est réduite en 9 x 8 niveaux de gris et chaque bit indique si un pixel est plus
+    clair que son voisin de droite. Insensible à la taille et à la recompression JPEG.
+    Le JPEG est décodé directement à basse résolution (draft), ce qui coûte peu même pour les images en cache.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class NearDuplicateIndex:
+    """
+    Hashes des images déjà retenues d'une source. find() retourne la source d'une image retenue dont le hash
+    est à une distance de Hamming d'au plus max_distance bits (0 = hashes identiques), ou None.
+    Un dHash seul confond des looks différents photographiés sur le même fond uni : avec min_similarity,
+    un candidat n'est confirmé que si la similarité cosinus de leurs embeddings CLIP normalisés atteint
+    min_similarity (les images retenues sans embedding ne confirment aucun candidat).
+    """
+    def __init__(self, max_distance, min_similarity=None):
+        self.max_distance = int(max_distance)
+        self.min_similarity = min_similarity
+        self._hashes = np.empty(64, dtype=np.uint64)
+        self._sources = []
+        self._embeddings = []
+
+    def __len__(self):
+        return len(self._sources)
+
+    def find(self, phash, embedding=None):
+        if not self._sources: return None
+        xor = self._hashes[:len(self._sources)] ^ np.uint64(phash)
+        distances = _POPCOUNT8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        candidates = np.flatnonzero(distances <= self.max_distance)
+        # Du plus proche au plus éloigné ; à distance égale, l'image retenue la plus ancienne
+        for i_candidate in candidates[np.argsort(distances[candidates], kind='stable')]:
+            if self.min_similarity is None: return self._sources[i_candidate]
+            candidate_embedding = self._embeddings[i_candidate]
+            if embedding is not None and candidate_embedding is not None and float(np.dot(candidate_embedding, embedding)) >= self.min_similarity:
+                return self._sources[i_candidate]
+        return None
+
+    def add(self, phash, source, embedding=None):
+        if len(self._sources) == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.empty(len(self._hashes), dtype=np.uint64)])
+        self._hashes[len(self._sources)] = phash
+        self._sources.append(source)
+        self._embeddings.append(None if embedding is None else np.asarray(embedding, dtype=np.float32).reshape(-1))
@@ -0,0 +1,20 @@
+# numpy_json.py - Sérialisation JSON des résultats d'analyse qui contiennent des valeurs NumPy
+import json
+import datetime
+import numpy as np
+
+
+class NumpyJSONEncoder(json.JSONEncoder):
+    """ Classe pour encoder correctement les types de données NumPy en JSON. """
+    def default(self, obj):
+        if isinstance(obj, np.integer): return int(obj)
+        elif isinstance(obj, np.floating): return float(obj)
+        elif isinstance(obj, np.bool_): return bool(obj)
+        elif isinstance(obj, np.ndarray): return obj.tolist()
+        elif isinstance(obj, (datetime.datetime, datetime.date)): return obj.isoformat()
+        return super(NumpyJSONEncoder, self).default(obj)
+
+
+def to_native(value):
+    """Copie de value en types natifs uniquement (les valeurs NumPy deviennent des float/int/listes), par un passage par JSON."""
+    return json.loads(json.dumps(value, cls=NumpyJSONEncoder))
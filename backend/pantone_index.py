@@ -0,0 +1,96 @@
+# pantone_index.py - Index Pantone précompilé (matrice L*a*b* + KD-tree)
+import os
+import sys
+import json
+import numpy as np
+
+DEFAULT_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pantone_colors.json')
+
+
+class PantoneIndex:
+    """
+    Recherche vectorisée de la couleur Pantone la plus proche.
+    La distance Delta E CIE76 étant la distance euclidienne dans L*a*b*, un KD-tree sur la
+    matrice Lab de la bibliothèque donne exactement le même résultat que le calcul exhaustif.
+    """
+    def __init__(self, names, hexes, labs):
+        self.names = [str(name) for name in names]
+        self.hexes = [str(hex_code) for hex_code in hexes]
+        self.labs = np.asarray(labs, dtype=np.float64).reshape(-1, 3)
+        # KD-tree (scipy) construit à la première requête
+        self._tree = None
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def artifact_path_for(json_path):
+        return os.path.splitext(json_path)[0] + '.npz'
+
+    @classmethod
+    def build(cls, json_path=DEFAULT_JSON_PATH):
+        """Parse le JSON Pantone et calcule la matrice Lab de toute la bibliothèque."""
+        from skimage.color import rgb2lab
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        names, hexes, rgbs = [], [], []
+        for code, details in data.items():
+            hex_code = details['hex'].lstrip('#')
+            names.append(f"PANTONE {code} {details['name'].replace('-', ' ').title()}")
+            hexes.append(f"#{hex_code}")
+            rgbs.append([int(hex_code[i:i+2], 16) for i in (0, 2, 4)])
+        labs = rgb2lab(np.array(rgbs, dtype=np.uint8).reshape(-1, 1, 3)).reshape(-1, 3)
+        return cls(names, hexes, labs)
+
+    def save(self, artifact_path):
+        tmp_path = f"{artifact_path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, names=np.array(self.names), hexes=np.array(self.hexes), labs=self.labs)
+        os.replace(tmp_path, artifact_path)
+
+    @classmethod
+    def load(cls, json_path=DEFAULT_JSON_PATH, artifact_path=None):
+        """
+        Charge l'artefact précompilé s'il est à jour par rapport au JSON ;
+        sinon reconstruit l'index depuis le JSON et tente de réécrire l'artefact.
+        """
+        artifact_path = artifact_path or cls.artifact_path_for(json_path)
+        json_mtime = os.path.getmtime(json_path) if os.path.exists(json_path) else 0
+        if os.path.exists(artifact_path) and os.path.getmtime(artifact_path) >= json_mtime:
+            try:
+                with np.load(artifact_path, allow_pickle=False) as artifact:
+                    return cls(artifact['names'], artifact['hexes'], artifact['labs'])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Artefact Pantone illisible ({artifact_path}) : {e}. Reconstruction.")
+        index = cls.build(json_path)
+        try:
+            index.save(artifact_path)
+        except OSError as e:
+            print(f"AVERTISSEMENT : impossible d'écrire l'artefact Pantone {artifact_path} : {e}")
+        return index
+
+    def query(self, rgb_colors):
+        """Retourne l'indice de la couleur Pantone la plus proche pour chaque couleur RGB (N x 3)."""
+        rgb = np.asarray(rgb_colors, dtype=np.float64).reshape(-1, 3)
+        if len(rgb) == 0: return np.array([], dtype=np.intp)
+        from skimage.color import rgb2lab
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.labs)
+        labs = rgb2lab(rgb.astype(np.uint8).reshape(-1, 1, 3)).reshape(-1, 3)
+        _, indices = self._tree.query(labs)
+        return indices
+
+    def match_many(self, rgb_colors):
+        return [(self.names[i], self.hexes[i]) for i in self.query(rgb_colors)]
+
+    def match(self, rgb_color):
+        return self.match_many([rgb_color])[0]
+
+
+if __name__ == '__main__':
+    # Précompile l'artefact (utilisé au build de l'image Docker)
+    json_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_JSON_PATH
+    index = PantoneIndex.build(json_path)
+    artifact_path = PantoneIndex.artifact_path_for(json_path)
+    index.save(artifact_path)
+    print(f"Index Pantone ({len(index)} couleurs) écrit dans {artifact_path}")
@@ -0,0 +1,75 @@
+# source_manifest.py - Manifest ETag par source pour la ré-analyse incrémentale
+import os
+import json
+import hashlib
+from numpy_json import to_native
+
+
+class SourceManifest:
+    """
+    Pour une source (ex. s3://trendsproject/images/tagwalk/<collection>) et des paramètres d'analyse
+    donnés, garde l'ETag S3 de chaque image analysée et son résultat par image (scores CLIP + couleurs).
+    Une image dont l'ETag n'a pas changé n'est pas ré-analysée : son résultat est réinjecté tel quel
+    dans l'agrégation. Les doublons écartés sont aussi mémorisés (avec l'image qu'ils répètent), et chaque
+    image analysée garde le hash SHA-256 de son contenu pour reconnaître ses copies exactes.
+    """
+    def __init__(self, cache_dir, image_source, params):
+        manifest_key = hashlib.sha1(json.dumps({'source': image_source, **params}, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, 'manifests', f"{manifest_key}.json")
+        self.image_source = image_source
+        self.params = params
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('entries', {})
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def lookup(self, image_uri, etag):
+        """Retourne (analysis_results, image_colors) si l'image a déjà été analysée avec ce même ETag."""
+        entry = self.entries.get(image_uri)
+        # Entrée sans digest (manifest antérieur) : ré-analysée pour que ses copies exactes soient reconnues
+        if not etag or entry is None or entry.get('etag') != etag or 'digest' not in entry: return None
+        return entry['analysis_results'], entry['colors']
+
+    def duplicate_of(self, image_uri, etag, current_etags):
+        """
+        Retourne l'image dont image_uri est un quasi-doublon, si c'était déjà le cas avec ce même ETag et que
+        l'original est toujours dans la source (current_etags : ETag de chaque image listée) avec l'ETag
+        qu'il avait alors. Sinon l'image doit être ré-analysée.
+        """
+        entry = self.entries.get(image_uri)
+        if not etag or entry is None or entry.get('etag') != etag: return None
+        original = entry.get('duplicate_of')
+        if original is None or not entry.get('original_etag') or current_etags.get(original) != entry['original_etag']: return None
+        return original
+
+    def perceptual_hash(self, image_uri):
+        entry = self.entries.get(image_uri)
+        return entry.get('phash') if entry else None
+
+    def digest(self, image_uri):
+        entry = self.entries.get(image_uri)
+        return entry.get('digest') if entry else None
+
+    def mark_duplicate(self, image_uri, etag, duplicate_of, original_etag):
+        if not etag: return
+        self.entries[image_uri] = {'etag': etag, 'duplicate_of': duplicate_of, 'original_etag': original_etag}
+
+    def update(self, image_uri, etag, analysis_results, image_colors, phash=None, digest=None):
+        if not etag: return
+        entry = {'etag': etag, 'analysis_results': analysis_results, 'colors': image_colors}
+        if phash is not None: entry['phash'] = phash
+        if digest is not None: entry['digest'] = digest
+        self.entries[image_uri] = to_native(entry)
+
+    def save(self, current_uris):
+        """Écrit le manifest en ne gardant que les images encore présentes dans la source."""
+        current_uris = set(current_uris)
+        self.entries = {uri: entry for uri, entry in self.entries.items() if uri in current_uris}
+        # Un doublon dont l'original a disparu de la source sera ré-analysé
+        self.entries = {uri: entry for uri, entry in self.entries.items() if entry.get('duplicate_of', uri) in self.entries}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': self.image_source, 'params': self.params, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.path)
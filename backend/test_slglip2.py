@@ -2,37 +2,47 @@ import os
 import sys
 import json
 import requests
-import torch
-import clip
 from PIL import Image
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from sklearn.cluster import KMeans
-import colorsys
 from collections import Counter
 from io import BytesIO
-import pandas as pd
-from matplotlib.patches import Rectangle
 import traceback
-from rembg import remove
 import datetime
-import boto3
 import argparse
-from skimage.color import rgb2lab, deltaE_cie76
+import hashlib
+import time
+import contextlib
+import re
+import itertools
+from collections import deque
+import threading
+import sqlite3
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from image_cache import ImageAnalysisCache
+from pantone_index import PantoneIndex
+from trend_aggregator import TrendAggregator, PARTIAL_DOMINANT_SAMPLE
+from source_manifest import SourceManifest
+from numpy_json import NumpyJSONEncoder
+from metrics import Metrics
+from near_duplicates import NearDuplicateIndex, perceptual_hash
+from color_extraction import ColorExtractor, match_pantone, _init_color_worker, extract_colors_from_bytes
+# Les dépendances lourdes (torch, clip, boto3, matplotlib, pandas, sklearn, skimage, rembg) sont importées
+# au premier usage de l'étape qui en a besoin : --help ou une analyse servie par les caches ne les paie pas.
 
 
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-class NumpyJSONEncoder(json.JSONEncoder):
-    """ Classe pour encoder correctement les types de données NumPy en JSON. """
-    def default(self, obj):
-        if isinstance(obj, np.integer): return int(obj)
-        elif isinstance(obj, np.floating): return float(obj)
-        elif isinstance(obj, np.ndarray): return obj.tolist()
-        elif isinstance(obj, (datetime.datetime, datetime.date)): return obj.isoformat()
-        return super(NumpyJSONEncoder, self).default(obj)
+CLIP_MODEL_NAME = "ViT-L/14@336px"
+# Modèles CLIP proposés, du plus rapide au plus précis (voir benchmark_models.py)
+CLIP_MODEL_TIERS = ["ViT-B/32", "ViT-B/16", "ViT-L/14", "ViT-L/14@336px"]
+# Résolution d'entrée des modèles CLIP qui ne la portent pas dans leur nom (224 px pour les autres)
+CLIP_INPUT_RESOLUTIONS = {"RN50x4": 288, "RN50x16": 384, "RN50x64": 448}
+# Extensions des images lues dans un dossier local
+LOCAL_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# Dossier des caches persistants (embeddings des labels, etc.), partagé entre les exécutions
+CACHE_DIR = os.environ.get("FASHION_TRENDS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fashion_trends"))
 
 TREND_MAP = {
     "Tops": ["t-shirt", "blouse", "shirt", "tank top", "crop top", "sweater", "cardigan", "hoodie", "sweatshirt", "turtleneck"],
@@ -47,53 +57,155 @@ TREND_MAP = {
 }
 
 class FashionTrendColorAnalyzer:
-    def __init__(self, image_source):
+    def __init__(self, image_source, prefetch_depth=16, prefetch_workers=8, color_mode='exact', pixel_budget=50000, mask_max_side=512, color_workers=0, inference_backend='torch', onnx_quantize=False, model_name=CLIP_MODEL_NAME, dedup_threshold=-1, dedup_min_similarity=0.95, color_max_side=1024):
+        import torch
         print("--- DÉBUT VÉRIFICATION GPU - VERSION 2 ---")
         print(f"Version de PyTorch : {torch.__version__}")
         print(f"CUDA est-il disponible ? : {torch.cuda.is_available()}")
         if torch.cuda.is_available():
             print(f"Nombre de GPU détectés : {torch.cuda.device_count()}")
             print(f"Nom du GPU : {torch.cuda.get_device_name(0)}")
-        self.image_source = image_source
+        # Pipeline de préchargement : nombre d'images en avance et de téléchargements simultanés
+        self.prefetch_depth = max(1, int(prefetch_depth))
+        self.prefetch_workers = max(1, int(prefetch_workers))
+        # Étape couleur (détourage, KMeans, Pantone) : en processus si color_workers vaut 0,
+        # sinon dans un ProcessPoolExecutor de color_workers processus
+        self.color_workers = max(0, int(color_workers))
+        # Quasi-doublons : distance de Hamming maximale entre dHash 64 bits (négatif = pas de dédoublonnage),
+        # et similarité cosinus CLIP minimale qui confirme un candidat. Désactivé par défaut : les deux seuils
+        # sont à calibrer sur des photos de défilé réelles (voir calibrate_dedup.py). Les copies exactes
+        # (mêmes octets) sont toujours écartées
+        self.dedup_threshold = int(dedup_threshold)
+        self.dedup_min_similarity = float(dedup_min_similarity)
+        self.color_pool = None
+        # Durées par étape et compteurs de la dernière analyse (réinitialisés à chaque analyze_fashion_trends)
+        self.metrics = Metrics()
+        # Un seul client S3 (thread-safe) partagé par tous les téléchargements, créé au premier accès
+        self._s3_client = None
+        self._s3_client_lock = threading.Lock()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Utilisation du device : {self.device}")
-        self.model, self.preprocess = clip.load("ViT-L/14@336px", device=self.device)
-        self.image_paths = self._collect_image_sources()
+        self.model_name = model_name
+        # Modèle CLIP chargé au premier encodage (voir la propriété model)
+        self._clip_model, self._clip_preprocess = None, None
+        # Encodeur d'images : PyTorch, ou ONNX Runtime sur CPU (export de model.visual, int8 en option).
+        # Les embeddings texte et le calcul des scores restent ceux de PyTorch.
+        if inference_backend not in ('torch', 'onnx'):
+            raise ValueError(f"Backend d'inférence inconnu : {inference_backend}")
+        self.inference_backend = inference_backend
+        self.onnx_quantize = onnx_quantize
+        self._onnx_encoder = None
+        self.image_source, self.image_paths = None, []
+        # ETag S3 de chaque image de la source (vide pour les sources JSON), pour la ré-analyse incrémentale
+        self.image_etags = {}
+        # La source peut être fournie plus tard (mode service : une source par tâche)
+        if image_source is not None: self.set_image_source(image_source)
         self.fashion_categories = [item for sublist in TREND_MAP.values() for item in sublist]
         self.pantone_library = self._load_pantone_library()
+        self.color_extractor = ColorExtractor(self.pantone_library, color_mode=color_mode, pixel_budget=pixel_budget, mask_max_side=mask_max_side, mask_cache_dir=os.path.join(CACHE_DIR, 'masks'), max_side=color_max_side)
         self.fashion_styles = ["minimalist", "streetwear", "bohemian", "vintage", "preppy", "athleisure", "business casual", "formal", "avant-garde", "sustainable", "cottagecore", "y2k", "goth", "punk", "grunge", "luxury", "haute couture", "casual", "resort wear", "workwear", "retro", "urban", "hip-hop", "sporty"]
+        self.garment_text_features = self._load_label_features(self.fashion_categories)
+        self.style_text_features = self._load_label_features(self.fashion_styles)
         self.fashion_color_ranges = [(0, 15, 'True Red', '#D12631', 'Pantone 18-1662 TCX'),(15, 30, 'Coral & Salmon', '#FF6F61', 'Pantone 16-1546 TCX'),(30, 45, 'Terracotta & Clay', '#BD4B37', 'Pantone 18-1438 TCX'),(45, 60, 'Amber & Caramel', '#D78A41', 'Pantone 16-1342 TCX'),(60, 75, 'Cognac & Rust', '#A5552A', 'Pantone 18-1248 TCX'),(75, 90, 'Mustard & Ochre', '#DBAF3A', 'Pantone 15-0948 TCX'),(90, 105, 'Canary & Lemon', '#F9E04C', 'Pantone 12-0643 TCX'),(105, 135, 'Olive & Moss', '#5E6738', 'Pantone 18-0430 TCX'),(135, 165, 'Sage & Mint', '#AABD8C', 'Pantone 15-6316 TCX'),(165, 195, 'Emerald & Jade', '#00A170', 'Pantone 17-5641 TCX'),(195, 225, 'Teal & Aqua', '#4799B7', 'Pantone 16-4834 TCX'),(225, 255, 'Cobalt & Denim', '#0047AB', 'Pantone 19-4045 TCX'),(255, 270, 'Navy & Indigo', '#1D334A', 'Pantone 19-4027 TCX'),(270, 285, 'Lavender & Lilac', '#B69FCB', 'Pantone 16-3416 TCX'),(285, 315, 'Violet & Amethyst', '#9678B6', 'Pantone 17-3628 TCX'),(315, 330, 'Mauve & Plum', '#8E4585', 'Pantone 19-2428 TCX'),(330, 345, 'Berry & Raspberry', '#C6174E', 'Pantone 18-2140 TCX'),(345, 360, 'Blush & Rose', '#E8B4B8', 'Pantone 14-1511 TCX')]
 
+    @property
+    def model(self):
+        """Modèle CLIP, chargé au premier usage : une analyse entièrement servie par les caches ne le charge pas."""
+        if self._clip_model is None:
+            import clip
+            print(f"Chargement du modèle CLIP {self.model_name}...")
+            self._clip_model, self._clip_preprocess = clip.load(self.model_name, device=self.device)
+        return self._clip_model
+
+    @property
+    def preprocess(self):
+        if self._clip_preprocess is None:
+            if self.inference_backend == 'onnx':
+                # Même prétraitement que clip.load, sans charger les poids PyTorch que l'encodeur ONNX remplace
+                from clip.clip import _transform
+                self._clip_preprocess = _transform(self.onnx_encoder.input_resolution)
+            else:
+                self.model
+        return self._clip_preprocess
+
+    @property
+    def onnx_encoder(self):
+        """
+        Encodeur ONNX Runtime, ou None avec le backend torch. Le modèle PyTorch n'est chargé que pour
+        exporter model.visual la première fois ; ensuite seul le fichier ONNX est lu.
+        """
+        if self.inference_backend != 'onnx': return None
+        if self._onnx_encoder is None:
+            from clip_onnx import OnnxImageEncoder
+            self._onnx_encoder = OnnxImageEncoder(lambda: self.model, self.model_name, os.path.join(CACHE_DIR, 'onnx'), quantize=self.onnx_quantize)
+            print(f"Encodeur d'images ONNX Runtime : {self._onnx_encoder.model_path}")
+        return self._onnx_encoder
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            with self._s3_client_lock:
+                if self._s3_client is None:
+                    import boto3
+                    from botocore.config import Config
+                    self._s3_client = boto3.client('s3', config=Config(max_pool_connections=max(10, self.prefetch_workers)))
+        return self._s3_client
+
+    def set_image_source(self, image_source):
+        """Change la source à analyser sans recharger le modèle ni la bibliothèque Pantone."""
+        self.image_source = image_source
+        self.image_paths = self._collect_image_sources()
+
+    def close(self):
+        """Arrête le pool de processus de l'étape couleur s'il a été démarré."""
+        if self.color_pool is not None:
+            self.color_pool.shutdown(cancel_futures=True)
+            self.color_pool = None
+
     def _hex_to_rgb(self, hex_code):
             """Convertit un code couleur HEX en tuple RGB."""
             hex_code = hex_code.lstrip('#')
             return tuple(int(hex_code[i:i+2], 16) for i in (0, 2, 4))
 
+    def _load_label_features(self, labels):
+        """
+        Retourne les embeddings texte normalisés d'une liste de labels, gardés sur le device.
+        Ils sont persistés sur disque, avec pour clé le nom du modèle et un hash de la liste.
+        """
+        import torch
+        labels_hash = hashlib.sha1(json.dumps(labels).encode('utf-8')).hexdigest()[:16]
+        safe_model_name = re.sub(r'[^A-Za-z0-9]+', '-', self.model_name).strip('-')
+        cache_path = os.path.join(CACHE_DIR, 'label_embeddings', f"{safe_model_name}_{labels_hash}.pt")
+
+        if os.path.exists(cache_path):
+            try:
+                return torch.load(cache_path, map_location=self.device)
+            except Exception as e:
+                print(f"Cache d'embeddings illisible ({cache_path}) : {e}. Recalcul.")
+
+        import clip
+        text_inputs = clip.tokenize(labels).to(self.device)
+        with torch.no_grad():
+            text_features = self.model.encode_text(text_inputs)
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            torch.save(text_features.cpu(), tmp_path)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"AVERTISSEMENT : impossible d'écrire le cache d'embeddings {cache_path} : {e}")
+        return text_features
+
     def _load_pantone_library(self, json_path='pantone_colors.json'):
-        """Charge et pré-calcule la bibliothèque de couleurs Pantone depuis un fichier JSON."""
+        """Charge l'index Pantone précompilé (reconstruit depuis le fichier JSON si nécessaire)."""
         try:
             # Pour gérer les cas où le script est appelé depuis un autre dossier
             script_dir = os.path.dirname(__file__)
             full_path = os.path.join(script_dir, json_path)
 
-            with open(full_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            library = []
-            for code, details in data.items():
-                rgb = self._hex_to_rgb(details['hex'])
-                library.append({
-                    'name': f"PANTONE {code} {details['name'].replace('-', ' ').title()}",
-                    'hex': f"#{details['hex']}",
-                    'rgb': rgb
-                })
-
-            rgb_colors = np.array([item['rgb'] for item in library])
-            lab_colors = rgb2lab(rgb_colors.reshape(len(rgb_colors), 1, 3).astype(np.uint8))
-
-            for i, item in enumerate(library):
-                item['lab'] = lab_colors[i][0]
-
+            library = PantoneIndex.load(full_path)
             print(f"Bibliothèque Pantone chargée avec {len(library)} couleurs.")
             return library
         except FileNotFoundError:
@@ -101,8 +213,9 @@ class FashionTrendColorAnalyzer:
             return None
     
     def _collect_image_sources(self):
-        """Collects image sources from either a JSON file with S3 URLs or an S3 folder path."""
+        """Collects image sources from a JSON file with S3 URLs, an S3 folder path or a local image folder."""
         image_sources = []
+        self.image_etags = {}
         source = self.image_source
 
         if source.lower().endswith('.json'): # From Instagram Scraper
@@ -114,7 +227,7 @@ class FashionTrendColorAnalyzer:
         
         elif source.startswith('s3://'): # From Web Scraper
             print(f"Source S3 détectée : {source}")
-            s3_client = boto3.client('s3')
+            s3_client = self.s3_client
             bucket_name, prefix = source.replace('s3://', '').split('/', 1)
             
             paginator = s3_client.get_paginator('list_objects_v2')
@@ -123,210 +236,444 @@ class FashionTrendColorAnalyzer:
                     key = obj['Key']
                     if key.lower().endswith(('.jpg', '.jpeg')):
                         image_sources.append(f's3://{bucket_name}/{key}')
+                        self.image_etags[f's3://{bucket_name}/{key}'] = obj.get('ETag')
+
+        elif os.path.isdir(source): # Dossier local (images de test, benchmarks)
+            print(f"Dossier local détecté : {source}")
+            for file_name in sorted(os.listdir(source)):
+                if file_name.lower().endswith(LOCAL_IMAGE_EXTENSIONS):
+                    image_sources.append(os.path.join(source, file_name))
         
         if not image_sources:
-            raise ValueError(f"Aucune image S3 trouvée pour la source {source}.")
+            raise ValueError(f"Aucune image trouvée pour la source {source}.")
             
-        print(f"Found {len(image_sources)} images to analyze from S3.")
+        print(f"Found {len(image_sources)} images to analyze.")
         return image_sources
 
     def _load_image(self, image_source):
-        # This function should already be correct from previous steps
-        # It must be able to handle s3:// paths
+        image_bytes = self._fetch_image_bytes(image_source)
+        return self._decode_image(image_bytes, image_source) if image_bytes is not None else None
+
+    def _fetch_image_bytes(self, image_source):
+        """Télécharge les octets bruts d'une image (le hash de ce contenu sert de clé de cache)."""
         try:
             if image_source.startswith('s3://'):
-                s3_client = boto3.client('s3')
                 bucket_name, key = image_source.replace('s3://', '').split('/', 1)
-                response = s3_client.get_object(Bucket=bucket_name, Key=key)
-                return Image.open(BytesIO(response['Body'].read())).convert('RGB')
-            # ... other loading logic can remain if needed ...
+                response = self.s3_client.get_object(Bucket=bucket_name, Key=key)
+                return response['Body'].read()
+            if os.path.isfile(image_source):
+                with open(image_source, 'rb') as f:
+                    return f.read()
         except Exception as e:
             print(f"Error loading {image_source}: {e}")
-            return None
+        return None
 
-    def _isolate_subject(self, image_pil):
+    def _clip_input_resolution(self):
+        if self._clip_model is not None: return self._clip_model.visual.input_resolution
+        match = re.search(r'@(\d+)px$', self.model_name)
+        return int(match.group(1)) if match else CLIP_INPUT_RESOLUTIONS.get(self.model_name, 224)
+
+    def _decode_image(self, image_bytes, image_source):
+        """
+        Décode l'image pour CLIP : les JPEG sont décodés à l'échelle réduite (draft) la plus petite dont le petit
+        côté reste au moins égal à la résolution d'entrée du modèle, que preprocess redimensionne ensuite.
+        L'étape couleur décode les octets de son côté (ColorExtractor.decode).
+        """
         try:
-            return remove(image_pil.convert('RGBA'))
+            with self.metrics.span('decode', source=image_source):
+                image = Image.open(BytesIO(image_bytes))
+                resolution = self._clip_input_resolution()
+                image.draft('RGB', (resolution, resolution))
+                image = image.convert('RGB')
+            self.metrics.incr('decoded_pixels', image.width * image.height)
+            return image
         except Exception as e:
-            print(f"Could not remove background: {e}. Using original image.")
-            return image_pil.convert('RGBA')
+            print(f"Error decoding {image_source}: {e}")
+            return None
+
+    def _iter_prefetched_images(self, image_sources, image_cache=None, perceptual_hashes=False, digest_owners=None):
+        """
+        Génère (source, digest, octets, image, hash perceptuel, doublon de) dans l'ordre de image_sources. Les images
+        suivantes sont téléchargées et décodées dans un pool de threads pendant que l'appelant traite les précédentes ;
+        au plus prefetch_depth images sont en attente à la fois.
+        Les images déjà présentes dans le cache ne sont ni conservées ni décodées (octets et image valent None).
+        Avec digest_owners (dictionnaire digest -> source), une image dont les octets sont identiques à ceux d'une
+        image précédente de image_sources (ou déjà présente dans digest_owners) est écartée : « doublon de » donne
+        la source de cette image. L'original est attribué ici, dans l'ordre des sources, et non dans l'ordre
+        de fin des téléchargements ; les threads se contentent de ne pas décoder une copie déjà identifiée.
+        Le hash perceptuel (dHash) n'est calculé qu'avec perceptual_hashes, y compris pour les images en cache.
+        """
+        def fetch(image_source):
+            with self.metrics.span('fetch', source=image_source):
+                image_bytes = self._fetch_image_bytes(image_source)
+            if image_bytes is None: return None, None, None, None
+            self.metrics.incr('bytes_fetched', len(image_bytes))
+            digest = ImageAnalysisCache.content_hash(image_bytes)
+            # Lecture seule : seul le générateur écrit dans digest_owners, et toujours pour une source précédente
+            if digest_owners is not None and digest in digest_owners: return digest, None, None, None
+            phash = None
+            if perceptual_hashes:
+                try:
+                    with self.metrics.span('perceptual_hash', source=image_source):
+                        phash = perceptual_hash(image_bytes)
+                except Exception as e:
+                    print(f"Hash perceptuel impossible pour {image_source} : {e}")
+            if image_cache is not None and digest in image_cache: return digest, None, None, phash
+            return digest, image_bytes, self._decode_image(image_bytes, image_source), phash
+
+        sources = iter(image_sources)
+        with ThreadPoolExecutor(max_workers=self.prefetch_workers) as executor:
+            pending = deque((src, executor.submit(fetch, src)) for src in itertools.islice(sources, self.prefetch_depth))
+            while pending:
+                image_source, future = pending.popleft()
+                next_source = next(sources, None)
+                if next_source is not None:
+                    pending.append((next_source, executor.submit(fetch, next_source)))
+                digest, image_bytes, image, phash = future.result()
+                duplicate_of = None
+                if digest_owners is not None and digest is not None:
+                    owner = digest_owners.setdefault(digest, image_source)
+                    if owner != image_source: image_bytes, image, phash, duplicate_of = None, None, None, owner
+                yield image_source, digest, image_bytes, image, phash, duplicate_of
+
+    def _isolate_subject(self, image_pil, digest=None):
+        return self.color_extractor.isolate_subject(image_pil, digest)
 
     def _classify_fashion_item(self, image_pil):
-        image_input = self.preprocess(image_pil).unsqueeze(0).to(self.device)
-        text_inputs = clip.tokenize(self.fashion_categories).to(self.device)
-        with torch.no_grad():
-            image_features = self.model.encode_image(image_input)
-            text_features = self.model.encode_text(text_inputs)
+        return self._classify_fashion_items([image_pil])[0]
+
+    def _classify_fashion_items(self, images_pil):
+        """Classifie un lot d'images en une seule passe CLIP (un tenseur N x 3 x H x W)."""
+        if not images_pil: return []
+        image_features = self._encode_images(images_pil)
+        return self._score_image_features(image_features)
+
+    def _encode_images(self, images_pil, use_onnx=None):
+        """Encode un lot d'images PIL et retourne les embeddings CLIP normalisés (backend ONNX s'il est chargé)."""
+        import torch
+        use_onnx = self.inference_backend == 'onnx' if use_onnx is None else use_onnx
+        image_input = torch.stack([self.preprocess(img) for img in images_pil])
+        with self.metrics.span('clip_encode', images=len(images_pil), backend='onnx' if use_onnx else 'torch'), torch.no_grad():
+            if use_onnx:
+                image_features = self.onnx_encoder.encode_image(image_input).to(self.device)
+            else:
+                image_features = self.model.encode_image(image_input.to(self.device))
             image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            logits_per_image = 100.0 * image_features @ text_features.T
-            probs = logits_per_image.softmax(dim=-1).squeeze().tolist()
-            all_garment_scores = sorted([(cat, prob) for cat, prob in zip(self.fashion_categories, probs)], key=lambda x: x[1], reverse=True)
-            style_inputs = clip.tokenize(self.fashion_styles).to(self.device)
-            style_features = self.model.encode_text(style_inputs)
-            style_features /= style_features.norm(dim=-1, keepdim=True)
-            style_logits = 100.0 * image_features @ style_features.T
-            style_probs = style_logits.softmax(dim=-1).squeeze().tolist()
-            all_style_scores = sorted([(style, prob) for style, prob in zip(self.fashion_styles, style_probs)], key=lambda x: x[1], reverse=True)
-            return {'garment_scores': all_garment_scores, 'style_scores': all_style_scores}
-
-    def analyze_fashion_trends(self, num_colors=15, min_cluster_size=100, confidence_threshold=0.01):
-        all_colors, all_color_objects, all_garment_types, all_style_types, self.image_analysis_results = [], [], [], [], []
+        return image_features
+
+    def _encoder_params(self):
+        """Backend de l'encodeur d'images, ajouté aux clés de cache quand ce n'est pas PyTorch."""
+        if self.inference_backend != 'onnx': return {}
+        return {'backend': 'onnx-int8' if self.onnx_quantize else 'onnx'}
+
+    def check_onnx_agreement(self, max_images=32, batch_size=8):
+        """
+        Classifie les max_images premières images de la source avec PyTorch puis avec ONNX Runtime,
+        et mesure l'accord des vêtements/styles top-1 entre les deux backends.
+        """
+        from clip_onnx import top1_agreement
+        if self.inference_backend != 'onnx':
+            raise ValueError("Le backend ONNX n'est pas chargé (utiliser --backend onnx).")
+        torch_results, onnx_results = [], []
+        prefetched = self._iter_prefetched_images(self.image_paths[:max_images])
+        while True:
+            loaded = list(itertools.islice(prefetched, batch_size))
+            if not loaded: break
+            batch = [image for _, _, _, image, _, _ in loaded if image is not None]
+            if not batch: continue
+            torch_results.extend(self._score_image_features(self._encode_images(batch, use_onnx=False).float()))
+            onnx_results.extend(self._score_image_features(self._encode_images(batch, use_onnx=True).float()))
+        return top1_agreement(torch_results, onnx_results)
+
+    def _score_image_features(self, image_features):
+        """Calcule les scores vêtements/styles triés pour chaque ligne d'embeddings normalisés."""
+        import torch
+        text_features = self.garment_text_features.to(dtype=image_features.dtype)
+        style_features = self.style_text_features.to(dtype=image_features.dtype)
+        with torch.no_grad():
+            probs = (100.0 * image_features @ text_features.T).softmax(dim=-1).tolist()
+            style_probs = (100.0 * image_features @ style_features.T).softmax(dim=-1).tolist()
+        results = []
+        for image_probs, image_style_probs in zip(probs, style_probs):
+            all_garment_scores = sorted([(cat, prob) for cat, prob in zip(self.fashion_categories, image_probs)], key=lambda x: x[1], reverse=True)
+            all_style_scores = sorted([(style, prob) for style, prob in zip(self.fashion_styles, image_style_probs)], key=lambda x: x[1], reverse=True)
+            results.append({'garment_scores': all_garment_scores, 'style_scores': all_style_scores})
+        return results
+
+    def _extract_image_colors(self, image_original, num_colors, min_cluster_size, digest=None, stats=None):
+        """Isole le sujet puis extrait les clusters de couleurs (KMeans) d'une image."""
+        return self.color_extractor.extract(image_original, num_colors, min_cluster_size, digest, stats)
+
+    def _record_color_stats(self, image_source, stats):
+        """Reporte dans les métriques les durées et nombres de pixels mesurés par l'extracteur de couleurs."""
+        for stage in ('decode', 'rembg', 'kmeans', 'pantone'):
+            if f'{stage}_seconds' in stats:
+                self.metrics.add_duration('color_decode' if stage == 'decode' else stage, stats[f'{stage}_seconds'], source=image_source)
+        for counter in ('subject_pixels', 'clustered_pixels'):
+            if counter in stats: self.metrics.incr(counter, stats[counter])
+
+    def _color_executor(self):
+        """
+        Pool de processus de l'étape couleur, ou None pour rester dans le processus principal.
+        Le pool est créé au premier usage puis réutilisé par les tâches suivantes (mode service).
+        """
+        if not self.color_workers: return None
+        if self.color_pool is None:
+            # forkserver : les processus sont forkés depuis un serveur qui n'a jamais exécuté torch
+            # (pas d'état OpenMP/CUDA hérité) et le module principal n'y est importé qu'une fois
+            context = multiprocessing.get_context('forkserver')
+            self.color_pool = ProcessPoolExecutor(max_workers=self.color_workers, mp_context=context, initializer=_init_color_worker, initargs=(self.color_extractor,))
+        return self.color_pool
+
+    def analyze_fashion_trends(self, num_colors=15, min_cluster_size=100, confidence_threshold=0.01, batch_size=8, use_cache=True, progress_callback=None, progress_interval=5.0, incremental=True, detail_top_k=None):
+        """
+        progress_callback(progress, partial_report), s'il est fourni, est appelé au plus toutes les
+        progress_interval secondes avec le pourcentage d'images traitées et le rapport partiel (format BDD,
+        sans le détail par image).
+        Les copies exactes d'une image précédente (mêmes octets) sont toujours écartées. Si dedup_threshold >= 0,
+        les quasi-doublons d'une image déjà retenue (dHash à au plus dedup_threshold bits et embeddings CLIP de
+        similarité cosinus >= dedup_min_similarity) le sont aussi, avant l'extraction des couleurs. Les deux sont
+        listés dans le bloc 'deduplication' du rapport.
+        Avec incremental, les images S3 dont l'ETag est inchangé depuis la dernière analyse de la même
+        source reprennent leur résultat du manifest ; seules les images nouvelles ou modifiées sont analysées.
+        Les images reprises restent des originaux possibles : par leur digest pour les copies exactes, et par
+        l'embedding CLIP du cache d'analyse (use_cache) pour les quasi-doublons.
+        Avec detail_top_k, le détail par image ne garde que les detail_top_k meilleurs scores vêtements et styles.
+        """
+        self.metrics = Metrics()
+        analysis_start = time.perf_counter()
+        aggregator = TrendAggregator(self.fashion_color_ranges, self._find_best_pantone_matches, confidence_threshold, detail_top_k=detail_top_k)
+        self.image_analysis_results = aggregator.image_analysis_results
+        self.metrics.incr('images_total', len(self.image_paths))
         print("\n--- Starting Main Trend Analysis ---")
-        for i, image_source in enumerate(self.image_paths):
-            print(f"Processing image {i+1}/{len(self.image_paths)}: {os.path.basename(image_source).split('?')[0]}")
-            try:
-                image_original = self._load_image(image_source)
-                if image_original is None: continue
-
-                analysis_results = self._classify_fashion_item(image_original)
-                garment_scores = analysis_results['garment_scores']
-                style_scores = analysis_results['style_scores']
-                
-                found_garments_with_scores = []
-                for category, score in garment_scores:
-                    if score > confidence_threshold:
-                        all_garment_types.append(category)
-                        found_garments_with_scores.append((category, score))
-                    else: break
-                
-                if not found_garments_with_scores and garment_scores:
-                    top_garment, top_score = garment_scores[0]
-                    all_garment_types.append(top_garment)
-                    found_garments_with_scores.append((top_garment, top_score))
-
-                if style_scores:
-                    all_style_types.append(style_scores[0][0])
-                
-                image_subject_only = self._isolate_subject(image_original)
-                img_array = np.array(image_subject_only)
-                
-                if img_array.shape[2] == 4:
-                    pixels_with_alpha = img_array.reshape(-1, 4)
-                    pixels = pixels_with_alpha[pixels_with_alpha[:, 3] > 50][:, :3]
+        params = {'model': self.model_name, 'num_colors': num_colors, 'min_cluster_size': min_cluster_size, **self._encoder_params(), **self.color_extractor.cache_params()}
+        dedup_index = NearDuplicateIndex(self.dedup_threshold, self.dedup_min_similarity) if self.dedup_threshold >= 0 else None
+        if dedup_index is not None: params.update(dedup_threshold=self.dedup_threshold, dedup_min_similarity=self.dedup_min_similarity)
+        manifest = SourceManifest(CACHE_DIR, self.image_source, params) if incremental and self.image_etags else None
+        image_cache = ImageAnalysisCache(CACHE_DIR, self.model_name, num_colors, min_cluster_size, self.garment_text_features.shape[-1], **self._encoder_params(), **self.color_extractor.cache_params()) if use_cache else None
+        # Contenu (SHA-256) -> première image qui l'a apporté, pour écarter les copies exactes
+        digest_owners = {}
+        image_sources = self.image_paths
+        if manifest is not None:
+            image_sources = []
+            for image_source in self.image_paths:
+                etag = self.image_etags.get(image_source)
+                previous = manifest.lookup(image_source, etag)
+                duplicate_of = manifest.duplicate_of(image_source, etag, self.image_etags)
+                digest = manifest.digest(image_source) if previous is not None else None
+                if duplicate_of is None and digest is not None:
+                    owner = digest_owners.setdefault(digest, image_source)
+                    if owner != image_source: duplicate_of = owner
+                if duplicate_of is not None:
+                    aggregator.add_duplicate(image_source, duplicate_of)
+                    manifest.mark_duplicate(image_source, etag, duplicate_of, self.image_etags.get(duplicate_of))
+                elif previous is None:
+                    image_sources.append(image_source)
                 else:
-                    pixels = img_array.reshape(-1, 3)
-
-                image_colors = []
-                if len(pixels) > num_colors:
-                    kmeans = KMeans(n_clusters=num_colors, n_init='auto', random_state=0).fit(pixels)
-                    labels = kmeans.labels_
-                    cluster_sizes = np.bincount(labels)
-                    for i_color, color in enumerate(kmeans.cluster_centers_):
-                        if i_color < len(cluster_sizes) and cluster_sizes[i_color] >= min_cluster_size:
-                            r, g, b = color
-                            h, s, v = colorsys.rgb_to_hsv(r/255.0, g/255.0, b/255.0)
-                            pantone_name, hex_color = self._find_best_pantone_match(color)
-                            color_obj = {'rgb': color.tolist(), 'hex': hex_color, 'hue': h * 360, 'saturation': s * 100, 'value': v * 100, 'brightness': np.mean(color), 'color_complexity': np.std(color), 'proportion': cluster_sizes[i_color] / len(pixels), 'pantone_ref': pantone_name, 'color_name': pantone_name}
-                            all_colors.append(color)
-                            all_color_objects.append(color_obj)
-                            image_colors.append(color_obj)
-                
-                self.image_analysis_results.append({'source': image_source, 'garment_analysis': analysis_results, 'colors': image_colors, 'found_garments_with_scores': found_garments_with_scores})
-            
-            except Exception as e:
-                print(f"An unexpected error occurred while processing {image_source}: {e}")
-                traceback.print_exc()
+                    aggregator.add_image(image_source, *previous)
+                    # Original possible d'un quasi-doublon parmi les nouvelles images : l'embedding vient du cache
+                    # d'analyse (sans embedding, aucun candidat ne serait confirmé par la similarité CLIP)
+                    phash = manifest.perceptual_hash(image_source)
+                    cached = image_cache.get(digest) if image_cache is not None else None
+                    if dedup_index is not None and phash is not None and cached is not None: dedup_index.add(phash, image_source, cached[0])
+            reused = len(self.image_paths) - len(image_sources) - len(aggregator.duplicates)
+            print(f"Manifest : {reused} images inchangées reprises, {len(aggregator.duplicates)} doublons déjà connus, {len(image_sources)} à analyser.")
+            self.metrics.incr('images_from_manifest', reused)
+            self.metrics.incr('duplicates_removed', len(aggregator.duplicates))
+
+        try:
+            self._run_analysis_batches(image_sources, image_cache, num_colors, min_cluster_size, batch_size, aggregator, progress_callback, progress_interval, manifest, dedup_index, digest_owners)
+        finally:
+            if image_cache is not None:
+                try:
+                    image_cache.flush()
+                except (OSError, sqlite3.Error) as e:
+                    print(f"AVERTISSEMENT : impossible d'écrire le cache d'analyse d'images : {e}")
+                image_cache.close()
+            if manifest is not None:
+                try:
+                    manifest.save(self.image_paths)
+                except OSError as e:
+                    print(f"AVERTISSEMENT : impossible d'écrire le manifest de la source : {e}")
+            self.metrics.add_duration('analyze', time.perf_counter() - analysis_start, images=len(self.image_paths))
 
-        if not all_garment_types:
+        if dedup_index is not None:
+            print(f"Dédoublonnage : {len(aggregator.duplicates)} doublons écartés (seuils {self.dedup_threshold} bits, similarité {self.dedup_min_similarity}).")
+        elif aggregator.duplicates:
+            print(f"Dédoublonnage : {len(aggregator.duplicates)} copies exactes écartées.")
+        if not aggregator.garment_counts:
             print("No data could be extracted.")
             return None, None
-        
-        color_analysis = self._analyze_fashion_color_distribution(all_color_objects, np.array(all_colors) if all_colors else np.array([]))
-        garment_counts = Counter(all_garment_types)
-        style_counts = Counter(all_style_types)
-        garment_distribution = {g: {'count': c} for g, c in garment_counts.most_common()}
-        style_distribution = {s: {'count': c} for s, c in style_counts.most_common()}
-        
-        color_garment_correlations = {}
-        for result in self.image_analysis_results:
-            for garment, score in result['found_garments_with_scores']:
-                if garment not in color_garment_correlations:
-                    color_garment_correlations[garment] = []
-                color_garment_correlations[garment].extend(result['colors'])
-        
-        garment_color_trends = {}
-        for garment, colors in color_garment_correlations.items():
-            if not colors: continue
-            color_bins = {}
-            for color in colors:
-                quantized_rgb = tuple(int(c / 25) * 25 for c in color.get('rgb', [0,0,0]))
-                if quantized_rgb not in color_bins: color_bins[quantized_rgb] = []
-                color_bins[quantized_rgb].append(color)
-            binned_colors = []
-            for bin_rgb, bin_colors in color_bins.items():
-                if not bin_colors: continue
-                avg_r, avg_g, avg_b = np.mean([c['rgb'] for c in bin_colors], axis=0)
-                rep_color = bin_colors[0].copy()
-                rep_color['rgb'] = np.array([avg_r, avg_g, avg_b])
-                # NOUVEAU CODE
-                pantone_name, hex_color = self._find_best_pantone_match(rep_color['rgb'])
-                rep_color['hex'] = hex_color
-                rep_color['pantone_ref'] = pantone_name
-                rep_color['color_name'] = pantone_name
-                rep_color['frequency'] = sum(c['proportion'] for c in bin_colors) * 100
-                binned_colors.append(rep_color)
-            garment_color_trends[garment] = sorted(binned_colors, key=lambda x: x['frequency'], reverse=True)
-
-        all_detected_garments_with_scores = [item for res in self.image_analysis_results for item in res['found_garments_with_scores']]
-
-        fashion_trends_dict = {
-            'color_trends': color_analysis,
-            'garment_trends': {'distribution': garment_distribution},
-            'style_trends': {'distribution': style_distribution},
-            'color_garment_trends': garment_color_trends,
-            'detailed_image_analysis': self.image_analysis_results
-        }
-        
-        return fashion_trends_dict, all_detected_garments_with_scores
+        return aggregator.report()
+
+    def _run_analysis_batches(self, image_sources, image_cache, num_colors, min_cluster_size, batch_size, aggregator, progress_callback=None, progress_interval=5.0, manifest=None, dedup_index=None, digest_owners=None):
+        """
+        Pipeline en deux étapes : classification CLIP par lots dans le processus principal, extraction
+        des couleurs dans le pool de processus. Les résultats sont fusionnés dans l'ordre des images.
+        digest_owners (digest -> source) contient les originaux déjà connus des copies exactes.
+        """
+        import torch
+        batch_size = max(1, int(batch_size))
+        cache_hits = 0
+        # Images classifiées dont les couleurs sont en cours d'extraction, dans l'ordre des images
+        pending = deque()
+        # Images terminées (fusionnées, reprises du manifest ou abandonnées), pour le pourcentage de progression
+        images_done = len(self.image_paths) - len(image_sources)
+        last_progress_time = time.monotonic()
+        # Durée du dernier rapport partiel (agrégation + transformation + envoi)
+        progress_cost = 0.0
+        # Hash perceptuel des images retenues, gardé dans le manifest
+        phashes = {}
+
+        def record(image_source, digest, feature_row, analysis_results, image_colors, from_cache):
+            if image_cache is not None and not from_cache:
+                image_cache.put(digest, feature_row.cpu().numpy(), image_colors)
+            aggregator.add_image(image_source, analysis_results, image_colors)
+            if manifest is not None:
+                manifest.update(image_source, self.image_etags.get(image_source), analysis_results, image_colors, phashes.pop(image_source, None), digest)
+
+        def record_duplicate(image_source, duplicate_of):
+            nonlocal images_done
+            images_done += 1
+            aggregator.add_duplicate(image_source, duplicate_of)
+            self.metrics.incr('duplicates_removed')
+            if manifest is not None: manifest.mark_duplicate(image_source, self.image_etags.get(image_source), duplicate_of, self.image_etags.get(duplicate_of))
+
+        def report_progress(force=False):
+            nonlocal last_progress_time, progress_cost
+            if progress_callback is None or not aggregator.garment_counts: return
+            # Un rapport partiel recalcule toute l'agrégation : l'intervalle s'allonge avec son coût
+            # pour que les rapports partiels restent sous ~10 % du temps d'analyse
+            if not force and time.monotonic() - last_progress_time < max(progress_interval, 10 * progress_cost): return
+            start = time.monotonic()
+            try:
+                partial_report, _ = aggregator.report(include_details=False, dominant_sample=PARTIAL_DOMINANT_SAMPLE)
+                progress_callback(100.0 * images_done / max(1, len(self.image_paths)), self._transform_results_for_db(partial_report))
+            except Exception as e:
+                print(f"AVERTISSEMENT : échec de l'envoi de la progression : {e}")
+            last_progress_time = time.monotonic()
+            progress_cost = last_progress_time - start
+            self.metrics.add_duration('partial_report', progress_cost)
+
+        def classify(entries):
+            # Seules les images absentes du cache passent par l'encodeur CLIP
+            to_encode = [image for _, _, _, image, cached in entries if cached is None]
+            encoded = iter(self._encode_images(to_encode)) if to_encode else iter(())
+            feature_rows = [torch.from_numpy(cached[0]).to(self.device) if cached is not None else next(encoded) for _, _, _, _, cached in entries]
+            image_features = torch.stack([row.float() for row in feature_rows])
+            return image_features, self._score_image_features(image_features)
+
+        def drain(max_pending):
+            # Fusionne les résultats de tête prêts ; bloque tant que la file dépasse max_pending
+            nonlocal images_done
+            while pending and (len(pending) > max_pending or not isinstance(pending[0][4], Future) or pending[0][4].done()):
+                image_source, digest, feature_row, analysis_results, colors, from_cache = pending.popleft()
+                images_done += 1
+                try:
+                    image_colors, color_stats = colors.result() if isinstance(colors, Future) else colors
+                    if color_stats: self._record_color_stats(image_source, color_stats)
+                    record(image_source, digest, feature_row, analysis_results, image_colors, from_cache)
+                except Exception as e:
+                    print(f"An unexpected error occurred while processing {image_source}: {e}")
+                    traceback.print_exc()
+
+        executor = self._color_executor()
+        try:
+            # Doublons exacts (mêmes octets) : écartés dès le téléchargement, sans décodage ni CLIP
+            if digest_owners is None: digest_owners = {}
+            prefetched = self._iter_prefetched_images(image_sources, image_cache, perceptual_hashes=dedup_index is not None, digest_owners=digest_owners)
+            for batch_start in range(0, len(image_sources), batch_size):
+                loaded = []
+                for i, (image_source, digest, image_bytes, image_original, phash, duplicate_of) in enumerate(itertools.islice(prefetched, batch_size), start=batch_start):
+                    print(f"Processing image {i+1}/{len(image_sources)}: {os.path.basename(image_source).split('?')[0]}")
+                    if digest is None:
+                        images_done += 1
+                        continue
+                    if duplicate_of is not None:
+                        print(f"Copie identique de {os.path.basename(duplicate_of).split('?')[0]} : image écartée.")
+                        record_duplicate(image_source, duplicate_of)
+                        continue
+                    if dedup_index is not None and phash is not None: phashes[image_source] = phash
+                    cached = image_cache.get(digest) if image_cache is not None else None
+                    if cached is None:
+                        if image_original is None:
+                            images_done += 1
+                            continue
+                    else:
+                        cache_hits += 1
+                        self.metrics.incr('cache_hits')
+                    loaded.append((image_source, digest, image_bytes, image_original, cached))
+                if not loaded: continue
+
+                try:
+                    image_features, batch_results = classify(loaded)
+                except Exception as e:
+                    # Une image illisible ne doit pas faire perdre tout le lot : nouvel essai image par image
+                    print(f"An unexpected error occurred while classifying batch starting at image {batch_start+1}: {e} (retrying image by image)")
+                    traceback.print_exc()
+                    classified = []
+                    for entry in loaded:
+                        try:
+                            classified.append((entry, *classify([entry])))
+                        except Exception as e:
+                            print(f"An unexpected error occurred while classifying {entry[0]}: {e}")
+                            images_done += 1
+                    if not classified: continue
+                    loaded = [entry for entry, _, _ in classified]
+                    image_features = torch.cat([features for _, features, _ in classified])
+                    batch_results = [results[0] for _, _, results in classified]
+
+                for (image_source, digest, image_bytes, image_original, cached), feature_row, analysis_results in zip(loaded, image_features, batch_results):
+                    if image_source in phashes:
+                        # Candidat quasi-doublon (dHash) confirmé par la similarité des embeddings CLIP, avant l'étape couleur
+                        embedding = feature_row.cpu().numpy()
+                        duplicate_of = dedup_index.find(phashes[image_source], embedding)
+                        if duplicate_of is not None:
+                            print(f"Quasi-doublon de {os.path.basename(duplicate_of).split('?')[0]} : image écartée.")
+                            phashes.pop(image_source)
+                            record_duplicate(image_source, duplicate_of)
+                            continue
+                        dedup_index.add(phashes[image_source], image_source, embedding)
+                    # colors : (couleurs, stats de l'extraction), ou un Future qui les retournera
+                    if cached is not None:
+                        colors = (cached[1], None)
+                    elif executor is not None:
+                        colors = executor.submit(extract_colors_from_bytes, image_bytes, num_colors, min_cluster_size, digest)
+                    else:
+                        try:
+                            color_stats = {}
+                            colors = (self.color_extractor.extract_from_bytes(image_bytes, num_colors, min_cluster_size, digest, color_stats), color_stats)
+                        except Exception as e:
+                            print(f"An unexpected error occurred while processing {image_source}: {e}")
+                            traceback.print_exc()
+                            images_done += 1
+                            continue
+                    pending.append((image_source, digest, feature_row, analysis_results, colors, cached is not None))
+                # La file reste bornée pour ne pas accumuler les images en mémoire si le pool prend du retard
+                drain(max_pending=4 * max(1, self.color_workers) + batch_size)
+                report_progress()
+            drain(max_pending=0)
+            report_progress(force=True)
+        finally:
+            # Une tâche interrompue ne doit pas laisser de travail en file pour la suivante
+            for entry in pending:
+                if isinstance(entry[4], Future): entry[4].cancel()
+
+        if image_cache is not None:
+            print(f"Cache d'analyse : {cache_hits}/{len(image_sources)} images déjà analysées.")
 
-    
-    
     # Dans le fichier test_slglip2.py, à l'intérieur de la classe FashionTrendColorAnalyzer
     def _find_best_pantone_match(self, rgb_color):
             """Trouve la couleur Pantone la plus proche en utilisant la distance Delta E dans l'espace L*a*b*."""
-            if not self.pantone_library:
-                hex_fallback = f"#{int(rgb_color[0]):02x}{int(rgb_color[1]):02x}{int(rgb_color[2]):02x}"
-                return "Custom", hex_fallback
-
-            input_lab = rgb2lab(np.array(rgb_color).reshape(1, 1, 3).astype(np.uint8))
-            library_labs = np.array([item['lab'] for item in self.pantone_library])
-            distances = deltaE_cie76(input_lab, library_labs)
-            closest_index = np.argmin(distances)
-            best_match = self.pantone_library[closest_index]
-            return best_match['name'], best_match['hex']
-    
+            return self._find_best_pantone_matches([rgb_color])[0]
 
-    def _analyze_fashion_color_distribution(self, color_objects, color_array):
-        if not color_objects: return {}
-        full_analysis = {'color_range_distribution': {}, 'color_metrics': {}, 'pantone_distribution': {}, 'dominant_colors': []}
-        for start, end, name, hex_color, pantone_code in self.fashion_color_ranges:
-            if start > end: in_range = [c for c in color_objects if c.get('hue') is not None and (c['hue'] >= start or c['hue'] < end)]
-            else: in_range = [c for c in color_objects if c.get('hue') is not None and start <= c['hue'] < end]
-            if not in_range: continue
-            full_analysis['color_range_distribution'][name] = {'count': len(in_range), 'percentage': len(in_range) / len(color_objects) * 100, 'representative_colors': [c['hex'] for c in sorted(in_range, key=lambda x: x.get('saturation', 0) * x.get('value', 0), reverse=True)[:3]], 'pantone_ref': pantone_code, 'primary_color': hex_color}
-        pantone_counts = Counter(c['pantone_ref'] for c in color_objects)
-        for pantone, count in pantone_counts.most_common(10):
-            if matching_colors := [c for c in color_objects if c['pantone_ref'] == pantone]: full_analysis['pantone_distribution'][pantone] = {'count': count, 'percentage': count / len(color_objects) * 100, 'representative_color': matching_colors[0]['hex']}
-        if color_array.size > 0:
-            n_dominant = min(10, len(np.unique(color_array, axis=0)))
-            if n_dominant > 0:
-                kmeans = KMeans(n_clusters=n_dominant, n_init='auto', random_state=0).fit(color_array)
-                labels = kmeans.labels_
-                label_counts = np.bincount(labels)
-                percentages = (label_counts / len(labels)) * 100 if len(labels) > 0 else []
-                dominant_colors_list = []
-                for i_color, color in enumerate(kmeans.cluster_centers_):
-                    if i_color < len(percentages):
-                        # NOUVEAU CODE
-                        pantone_name, hex_color = self._find_best_pantone_match(color)
-                        dominant_colors_list.append({'rgb': [int(c) for c in color], 'hex': hex_color, 'pantone_ref': pantone_name, 'color_name': pantone_name, 'percentage': percentages[i_color]})
-                full_analysis['dominant_colors'] = sorted(dominant_colors_list, key=lambda x: x['percentage'], reverse=True)
-        unique_hex = set(c['hex'] for c in color_objects)
-        full_analysis['color_metrics'] = {'total_unique_colors': len(unique_hex), 'average_saturation': np.mean([c.get('saturation', 0) for c in color_objects]) if color_objects else 0, 'average_brightness': np.mean([c.get('value', 0) for c in color_objects]) if color_objects else 0, 'color_diversity_index': len(unique_hex) / len(color_objects) if color_objects else 0}
-        return full_analysis
+    def _find_best_pantone_matches(self, rgb_colors):
+            """Version vectorisée : une seule requête KD-tree pour toutes les couleurs RGB données."""
+            return match_pantone(self.pantone_library, rgb_colors)
+    
 
     def visualize_fashion_trends(self, fashion_trends, weighted_garment_counts):
+        import matplotlib.pyplot as plt
         if not fashion_trends: print("Insufficient data for visualization"); return
         color_trends, style_trends, color_garment_trends = fashion_trends.get('color_trends', {}), fashion_trends.get('style_trends', {}), fashion_trends.get('color_garment_trends', {})
         
@@ -401,6 +748,8 @@ class FashionTrendColorAnalyzer:
         return (r * 0.299 + g * 0.587 + b * 0.114) < 140
 
     def export_pantone_style_report(self, fashion_trends, weighted_garment_counts, output_path='fashion_trend_report.pdf'):
+        import matplotlib.pyplot as plt
+        import pandas as pd
         from matplotlib.backends.backend_pdf import PdfPages
         if not fashion_trends: print("No data to export."); return
         with PdfPages(output_path) as pdf:
@@ -453,6 +802,7 @@ class FashionTrendColorAnalyzer:
         pour correspondre exactement au schéma de la base de données MongoDB.
         """
         print("Transformation des résultats pour le format de la base de données...")
+        transform_start = time.perf_counter()
         db_doc = {}
 
         # 1. Transformer color_trends
@@ -538,22 +888,69 @@ class FashionTrendColorAnalyzer:
             db_detailed_analysis.append(db_item)
         db_doc['detailed_image_analysis'] = db_detailed_analysis
 
+        # 6. Quasi-doublons écartés avant l'analyse
+        db_doc['deduplication'] = fashion_trends_dict.get('deduplication', {'duplicates_removed': 0, 'duplicates': []})
+
+        self.metrics.add_duration('transform_results', time.perf_counter() - transform_start)
         return db_doc
     
-    def export_to_json(self, data_to_export, output_path='fashion_trends_report.json'):
+    def export_to_json(self, data_to_export, output_path='fashion_trends_report.json', compact=False):
         try:
             final_json_data = {
                 "source_file": self.image_source,
                 "analyzed_at": datetime.datetime.now(),
                 **data_to_export
             }
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(final_json_data, f, cls=NumpyJSONEncoder, ensure_ascii=False, indent=4)
+            # Format compact : ni indentation ni espaces après les séparateurs
+            layout = {'separators': (',', ':')} if compact else {'indent': 4}
+            with self.metrics.span('export_json', path=output_path):
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(final_json_data, f, cls=NumpyJSONEncoder, ensure_ascii=False, **layout)
             print(f"Rapport JSON (format BDD) exporté vers {output_path}")
         except Exception as e:
             print(f"Erreur lors de l'export JSON : {e}")
             traceback.print_exc()
 
+    def export_compact(self, fashion_trends_dict, data_to_export, output_prefix, upload_uri=None):
+        """
+        Rapport compact : le détail par image (fashion_trends_dict brut, scores top-k) est écrit en colonnes
+        dans <output_prefix>.parquet, et le reste du rapport BDD dans un petit JSON <output_prefix>.json,
+        sans indentation, qui référence le fichier Parquet. Le JSON garde la liste des images analysées
+        (detailed_image_analysis réduit à {'source': ...}, lu par la galerie de app.py). Retourne le chemin du JSON.
+        Avec upload_uri (s3://bucket/clé), le fichier Parquet est envoyé sur S3 puis supprimé du disque,
+        et c'est cette URI que référence le rapport.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet_path, json_path = f'{output_prefix}.parquet', f'{output_prefix}.json'
+        labels_scores = pa.struct([('label', pa.string()), ('score', pa.float32())])
+        color_type = pa.struct([('rgb', pa.list_(pa.uint8())), ('hex', pa.string()), ('pantone_ref', pa.string()), ('proportion', pa.float32())])
+        schema = pa.schema([('source', pa.string()), ('garment_scores', pa.list_(labels_scores)), ('style_scores', pa.list_(labels_scores)), ('found_garments', pa.list_(labels_scores)), ('colors', pa.list_(color_type))])
+        scored = lambda pairs: [{'label': label, 'score': float(score)} for label, score in pairs]
+        details = fashion_trends_dict.get('detailed_image_analysis', [])
+        with self.metrics.span('export_parquet', path=parquet_path, images=len(details)):
+            table = pa.Table.from_pydict({
+                'source': [item['source'] for item in details],
+                'garment_scores': [scored(item['garment_analysis'].get('garment_scores', [])) for item in details],
+                'style_scores': [scored(item['garment_analysis'].get('style_scores', [])) for item in details],
+                'found_garments': [scored(item.get('found_garments_with_scores', [])) for item in details],
+                'colors': [[{'rgb': [int(c) for c in color['rgb']], 'hex': color.get('hex'), 'pantone_ref': color.get('pantone_ref'), 'proportion': float(color.get('proportion', 0))} for color in item.get('colors', [])] for item in details],
+            }, schema=schema)
+            pq.write_table(table, parquet_path, compression='zstd')
+        detail_file = parquet_path
+        if upload_uri:
+            bucket_name, key = upload_uri.replace('s3://', '').split('/', 1)
+            try:
+                with self.metrics.span('upload_parquet', uri=upload_uri):
+                    self.s3_client.upload_file(parquet_path, bucket_name, key)
+            finally:
+                os.remove(parquet_path)
+            detail_file = upload_uri
+        summary = {**data_to_export, 'detailed_image_analysis': [{'source': item['source']} for item in details], 'detailed_image_analysis_file': detail_file}
+        self.export_to_json(summary, json_path, compact=True)
+        return json_path
+
 
 def update_job_on_api(json_report_path, api_url, job_id):
     """Met à jour une tâche spécifique via l'API backend avec les résultats."""
@@ -577,28 +974,133 @@ def update_job_on_api(json_report_path, api_url, job_id):
     return None
 
 
-# NOUVELLE VERSION CORRIGÉE de main()
+def print_progress(progress, partial_result):
+    """Progression en mode processus unique : une ligne PROGRESS:<json> lue par Node.js."""
+    print(f"PROGRESS:{json.dumps({'progress': progress, 'partial_result': partial_result}, cls=NumpyJSONEncoder, ensure_ascii=False)}", flush=True)
+
+
+def run_job(analyzer, job_id, args, threshold=None, progress_callback=print_progress, compact=None, top_k=None):
+    """
+    Analyse la source courante de l'analyseur et exporte le rapport ; retourne son chemin (ou None).
+    compact et top_k (options de la tâche) remplacent --compact et --top_k s'ils sont fournis.
+    """
+    compact = args.compact if compact is None else compact
+    top_k = args.top_k if top_k is None else int(top_k)
+    fashion_trends_raw, all_detected_garments_with_scores = analyzer.analyze_fashion_trends(confidence_threshold=args.threshold if threshold is None else threshold, batch_size=args.batch_size, use_cache=not args.no_cache, progress_callback=progress_callback, progress_interval=args.progress_interval, incremental=not args.full_refresh, detail_top_k=top_k if compact else None)
+    if not fashion_trends_raw:
+        return None
+    print("\n--- Lancement de la Transformation ---", file=sys.stderr)
+    if compact:
+        # Le détail par image part dans le fichier Parquet : le rapport BDD n'en a pas besoin
+        fashion_trends_for_db = analyzer._transform_results_for_db({**fashion_trends_raw, 'detailed_image_analysis': []})
+    else:
+        fashion_trends_for_db = analyzer._transform_results_for_db(fashion_trends_raw)
+    # Durées par étape et compteurs de l'analyse, envoyés avec le rapport
+    fashion_trends_for_db['metrics'] = analyzer.metrics.summary()
+    # On utilise un nom de fichier unique basé sur le job_id dans /tmp
+    if compact:
+        upload_uri = f"{args.report_s3_prefix.rstrip('/')}/{job_id}.parquet" if args.report_s3_prefix else None
+        return analyzer.export_compact(fashion_trends_raw, fashion_trends_for_db, f'/tmp/report_{job_id}', upload_uri)
+    json_output_path = f'/tmp/report_{job_id}.json'
+    analyzer.export_to_json(fashion_trends_for_db, json_output_path)
+    return json_output_path
+
+
+def serve(args):
+    """
+    Mode service : le modèle CLIP et la bibliothèque Pantone sont chargés une seule fois, puis les tâches
+    sont lues sur stdin, une par ligne JSON : {"job_id": ..., "source": ..., "threshold": ..., "compact": ..., "top_k": ...}
+    (les trois dernières clés sont optionnelles).
+    Chaque tâche produit une ligne JSON sur stdout :
+    {"job_id": ..., "status": "completed", "report_file_path": ...} ou {"job_id": ..., "status": "failed", "error": ...},
+    précédée de lignes {"job_id": ..., "status": "progress", "progress": ..., "partial_result": ...} pendant l'analyse.
+    Tous les autres messages sont redirigés vers stderr pour garder stdout réservé au protocole.
+    """
+    protocol_out = sys.stdout
+
+    def reply(message):
+        protocol_out.write(json.dumps(message, cls=NumpyJSONEncoder, ensure_ascii=False) + "\n")
+        protocol_out.flush()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        analyzer = FashionTrendColorAnalyzer(None, **analyzer_options(args))
+        reply({"status": "ready"})
+        try:
+            for line in sys.stdin:
+                if not line.strip(): continue
+                job_id = None
+                try:
+                    job = json.loads(line)
+                    job_id = job["job_id"]
+                    analyzer.set_image_source(job["source"])
+                    on_progress = lambda progress, partial_result, job_id=job_id: reply({"job_id": job_id, "status": "progress", "progress": progress, "partial_result": partial_result})
+                    report_path = run_job(analyzer, job_id, args, threshold=job.get("threshold"), progress_callback=on_progress, compact=job.get("compact"), top_k=job.get("top_k"))
+                    if report_path:
+                        reply({"job_id": job_id, "status": "completed", "report_file_path": report_path})
+                    else:
+                        reply({"job_id": job_id, "status": "failed", "error": "Aucune donnée n'a pu être analysée."})
+                except Exception as e:
+                    traceback.print_exc()
+                    reply({"job_id": job_id, "status": "failed", "error": str(e)})
+        finally:
+            analyzer.close()
+
+
+def analyzer_options(args):
+    return dict(prefetch_depth=args.prefetch_depth, prefetch_workers=args.prefetch_workers, color_mode=args.color_mode, pixel_budget=args.pixel_budget, mask_max_side=args.mask_max_side, color_workers=args.color_workers, color_max_side=args.color_max_side, inference_backend=args.backend, onnx_quantize=args.quantize, model_name=args.model, dedup_threshold=args.dedup_threshold, dedup_min_similarity=args.dedup_similarity)
 
-# Dans test_slglip2.py
 
 def main():
     parser = argparse.ArgumentParser(description="Analyseur de tendances de mode.")
-    parser.add_argument("source", help="Chemin S3 ou JSON local à analyser.")
-    parser.add_argument("--job_id", required=True, help="ID de la tâche en cours.")
+    parser.add_argument("source", nargs="?", help="Chemin S3, JSON local ou dossier local d'images à analyser.")
+    parser.add_argument("--job_id", help="ID de la tâche en cours.")
+    parser.add_argument("--serve", action="store_true", help="Mode service : traite les tâches reçues en JSON lines sur stdin.")
     parser.add_argument("--threshold", type=float, default=0.10, help="Seuil de confiance.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Nombre d'images encodées ensemble par CLIP.")
+    parser.add_argument("--prefetch_depth", type=int, default=16, help="Nombre d'images téléchargées à l'avance.")
+    parser.add_argument("--prefetch_workers", type=int, default=8, help="Nombre de téléchargements S3 simultanés.")
+    parser.add_argument("--color_mode", choices=["exact", "fast"], default="exact", help="Extraction des couleurs : KMeans exact ou échantillonnage + MiniBatchKMeans.")
+    parser.add_argument("--pixel_budget", type=int, default=50000, help="Nombre maximal de pixels clusterisés par image en mode fast.")
+    parser.add_argument("--mask_max_side", type=int, default=512, help="Plus grand côté de l'image utilisée pour le détourage (0 = pleine résolution).")
+    parser.add_argument("--color_max_side", type=int, default=1024, help="Plus grand côté de l'image décodée pour l'extraction des couleurs (0 = pleine résolution).")
+    parser.add_argument("--color_workers", type=int, default=0, help="Processus dédiés à l'extraction des couleurs (0 = processus principal).")
+    parser.add_argument("--progress_interval", type=float, default=5.0, help="Intervalle minimal (s) entre deux envois de résultats partiels.")
+    parser.add_argument("--full_refresh", action="store_true", help="Ré-analyse toutes les images de la source, sans reprendre le manifest ETag.")
+    parser.add_argument("--no_cache", action="store_true", help="Désactive le cache disque des analyses par image.")
+    parser.add_argument("--dedup_threshold", type=int, default=-1, help="Distance de Hamming maximale (bits, dHash 64 bits) entre quasi-doublons ; négatif = désactivé (défaut). Les copies exactes sont toujours écartées.")
+    parser.add_argument("--dedup_similarity", type=float, default=0.95, help="Similarité cosinus CLIP minimale pour confirmer un quasi-doublon.")
+    parser.add_argument("--compact", action="store_true", help="Rapport compact : détail par image en Parquet (scores top-k) et résumé JSON sans indentation.")
+    parser.add_argument("--top_k", type=int, default=5, help="Avec --compact : nombre de scores vêtements et styles gardés par image.")
+    parser.add_argument("--report_s3_prefix", default="s3://trendsproject/reports", help="Avec --compact : préfixe S3 où le détail Parquet de chaque tâche est envoyé (vide = fichier gardé dans /tmp).")
+    parser.add_argument("--model", default=CLIP_MODEL_NAME, help=f"Modèle CLIP ({', '.join(CLIP_MODEL_TIERS)}).")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Encodeur d'images CLIP : PyTorch ou ONNX Runtime (CPU).")
+    parser.add_argument("--quantize", action="store_true", help="Avec --backend onnx : encodeur quantifié en int8.")
+    parser.add_argument("--check_onnx", type=int, default=0, metavar="N", help="Mesure l'accord top-1 ONNX/PyTorch sur les N premières images de la source, puis quitte.")
     args = parser.parse_args()
 
+    if args.serve:
+        serve(args)
+        return
+    if args.check_onnx:
+        if not args.source:
+            parser.error("source est obligatoire avec --check_onnx.")
+        analyzer = FashionTrendColorAnalyzer(args.source, **{**analyzer_options(args), 'inference_backend': 'onnx'})
+        try:
+            print(f"ONNX_AGREEMENT:{json.dumps(analyzer.check_onnx_agreement(args.check_onnx, args.batch_size))}")
+        finally:
+            analyzer.close()
+        return
+    if not args.source or not args.job_id:
+        parser.error("source et --job_id sont obligatoires hors mode --serve.")
+
     try:
-        analyzer = FashionTrendColorAnalyzer(args.source)
-        fashion_trends_raw, all_detected_garments_with_scores = analyzer.analyze_fashion_trends(confidence_threshold=args.threshold)
-        
-        if fashion_trends_raw:
-            print("\n--- Lancement de la Transformation ---", file=sys.stderr)
-            fashion_trends_for_db = analyzer._transform_results_for_db(fashion_trends_raw)
-            # On utilise un nom de fichier unique basé sur le job_id dans /tmp
-            json_output_path = f'/tmp/report_{args.job_id}.json'
-            analyzer.export_to_json(fashion_trends_for_db, json_output_path)
-            
+        analyzer = FashionTrendColorAnalyzer(args.source, **analyzer_options(args))
+        try:
+            json_output_path = run_job(analyzer, args.job_id, args)
+        finally:
+            analyzer.close()
+
+        if json_output_path:
             # On imprime le chemin du rapport pour que Node.js le récupère
             print(f"REPORT_FILE_PATH:{json_output_path}")
             
@@ -0,0 +1,5 @@
+# conftest.py - Les modules du backend sont importés directement depuis backend/
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,84 @@
+# test_analysis_cache.py - Écriture et relecture du cache d'analyse par image, étape couleur dans le processus principal
+import pytest
+import numpy as np
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+from test_slglip2 import FashionTrendColorAnalyzer
+from image_cache import ImageAnalysisCache
+from trend_aggregator import TrendAggregator
+from metrics import Metrics
+
+EMBEDDING_DIM = 8
+COLOR = {'rgb': [10.0, 20.0, 30.0], 'hex': '#0a141e', 'hue': 210.0, 'saturation': 66.7, 'value': 11.8, 'brightness': 20.0, 'color_complexity': 8.2, 'proportion': 1.0, 'pantone_ref': 'P', 'color_name': 'P'}
+
+
+class CountingExtractor:
+    def __init__(self):
+        self.calls = 0
+
+    def extract_from_bytes(self, image_bytes, num_colors, min_cluster_size, digest=None, stats=None):
+        self.calls += 1
+        return [dict(COLOR)]
+
+
+def make_analyzer(image_paths):
+    """Analyseur sans modèle CLIP : l'encodeur et le scoring sont remplacés par des fonctions déterministes."""
+    analyzer = FashionTrendColorAnalyzer.__new__(FashionTrendColorAnalyzer)
+    analyzer.metrics = Metrics(emit=False)
+    analyzer.prefetch_depth, analyzer.prefetch_workers = 4, 2
+    analyzer.color_workers, analyzer.color_pool = 0, None
+    analyzer.dedup_threshold = -1
+    analyzer.image_paths, analyzer.image_etags = list(image_paths), {}
+    analyzer.device, analyzer.model_name, analyzer._clip_model = 'cpu', 'ViT-B/32', None
+    analyzer.fashion_color_ranges = [(0, 360, 'All', '#000000', 'P')]
+    analyzer._find_best_pantone_matches = lambda colors: [('P', '#000000')] * len(colors)
+    analyzer.color_extractor = CountingExtractor()
+    analyzer.encoded_images = 0
+
+    def encode_images(images, use_onnx=None):
+        analyzer.encoded_images += len(images)
+        rows = torch.tensor([np.resize(np.asarray(image, dtype=np.float32).mean(axis=(0, 1)), EMBEDDING_DIM) + 1 for image in images])
+        return rows / rows.norm(dim=-1, keepdim=True)
+
+    analyzer._encode_images = encode_images
+    analyzer._score_image_features = lambda features: [{'garment_scores': [('dress', 0.9), ('coat', 0.1)], 'style_scores': [('minimalist', 1.0)]} for _ in range(len(features))]
+    return analyzer
+
+
+def run(analyzer, image_cache):
+    aggregator = TrendAggregator(analyzer.fashion_color_ranges, analyzer._find_best_pantone_matches, 0.1)
+    analyzer._run_analysis_batches(analyzer.image_paths, image_cache, 15, 100, 2, aggregator)
+    image_cache.flush()
+    return aggregator
+
+
+def test_in_process_color_results_are_cached(tmp_path):
+    image_paths = []
+    for i in range(5):
+        path = tmp_path / f"look_{i}.jpg"
+        Image.new('RGB', (48, 64), (40 * i, 100, 200 - 30 * i)).save(path)
+        image_paths.append(str(path))
+    cache_dir = tmp_path / 'cache'
+
+    analyzer = make_analyzer(image_paths)
+    aggregator = run(analyzer, ImageAnalysisCache(str(cache_dir), 'ViT-B/32', 15, 100, EMBEDDING_DIM))
+    assert len(aggregator.image_analysis_results) == 5
+    assert analyzer.color_extractor.calls == 5
+
+    # Nouveau cache relu depuis le disque : chaque image doit y être, couleurs comprises
+    image_cache = ImageAnalysisCache(str(cache_dir), 'ViT-B/32', 15, 100, EMBEDDING_DIM)
+    assert len(image_cache) == 5
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            embedding, colors = image_cache.get(ImageAnalysisCache.content_hash(f.read()))
+        assert embedding.shape == (EMBEDDING_DIM,)
+        assert colors[0]['hex'] == COLOR['hex']
+
+    # Deuxième analyse : tout vient du cache, ni CLIP ni extraction des couleurs
+    analyzer = make_analyzer(image_paths)
+    aggregator = run(analyzer, image_cache)
+    assert len(aggregator.image_analysis_results) == 5
+    assert analyzer.encoded_images == 0
+    assert analyzer.color_extractor.calls == 0
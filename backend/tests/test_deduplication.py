@@ -0,0 +1,79 @@
+# test_deduplication.py - Copies exactes et quasi-doublons, y compris face aux images reprises du manifest
+import time
+import shutil
+import pytest
+import numpy as np
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+import test_slglip2
+from test_analysis_cache import make_analyzer
+
+
+def save_look(path, color, size=(64, 96)):
+    """Look synthétique : dégradé horizontal (dHash stable au redimensionnement) teinté par color."""
+    image = Image.new('RGB', size)
+    image.putdata([tuple(min(255, c + 3 * (x * 64 // size[0])) for c in color) for y in range(size[1]) for x in range(size[0])])
+    image.save(path, quality=95)
+    return str(path)
+
+
+def test_exact_copy_owner_follows_source_order(tmp_path):
+    original = save_look(tmp_path / 'original.jpg', (120, 40, 40))
+    copy = str(tmp_path / 'copy.jpg')
+    shutil.copyfile(original, copy)
+    analyzer = make_analyzer([original, copy])
+    fetch = analyzer._fetch_image_bytes
+
+    def slow_first_fetch(image_source):
+        # L'original finit de télécharger après sa copie
+        if image_source == original: time.sleep(0.2)
+        return fetch(image_source)
+
+    analyzer._fetch_image_bytes = slow_first_fetch
+    results = list(analyzer._iter_prefetched_images([original, copy], digest_owners={}))
+    assert [duplicate_of for *_, duplicate_of in results] == [None, original]
+    assert results[0][3] is not None and results[1][3] is None
+
+
+def test_reused_images_remain_duplicate_originals(tmp_path, monkeypatch):
+    monkeypatch.setattr(test_slglip2, 'CACHE_DIR', str(tmp_path / 'cache'))
+    first = save_look(tmp_path / 'first.jpg', (120, 40, 40))
+    other = save_look(tmp_path / 'other.jpg', (20, 90, 160))
+    etags = {first: '"1"', other: '"2"'}
+
+    def analyze(image_paths):
+        analyzer = make_analyzer(image_paths)
+        analyzer.image_source, analyzer.image_etags = str(tmp_path), {path: etags[path] for path in image_paths}
+        analyzer.dedup_threshold, analyzer.dedup_min_similarity = 4, 0.95
+        analyzer.garment_text_features = np.zeros((2, 8), dtype=np.float32)
+        analyzer._encoder_params = lambda: {}
+        analyzer.color_extractor.cache_params = lambda: {}
+        trends, _ = analyzer.analyze_fashion_trends()
+        return analyzer, trends['deduplication']
+
+    analyze([first, other])
+
+    # Deuxième passage : les deux images sont reprises du manifest, puis arrivent une copie exacte
+    # et une version redimensionnée de la première
+    copy = str(tmp_path / 'copy.jpg')
+    shutil.copyfile(first, copy)
+    resized = save_look(tmp_path / 'resized.jpg', (120, 40, 40), size=(48, 72))
+    etags.update({copy: '"3"', resized: '"4"'})
+    analyzer, deduplication = analyze([first, other, copy, resized])
+    # Seule la version redimensionnée passe par CLIP, et aucune des deux par l'étape couleur
+    assert analyzer.encoded_images == 1
+    assert [(d['source'], d['duplicate_of']) for d in deduplication['duplicates']] == [(copy, first), (resized, first)]
+    assert analyzer.color_extractor.calls == 0
+
+
+def test_exact_copies_dropped_with_near_duplicates_disabled(tmp_path):
+    original = save_look(tmp_path / 'original.jpg', (120, 40, 40))
+    copy = str(tmp_path / 'copy.jpg')
+    shutil.copyfile(original, copy)
+    analyzer = make_analyzer([original, copy])
+    aggregator = test_slglip2.TrendAggregator(analyzer.fashion_color_ranges, analyzer._find_best_pantone_matches, 0.1)
+    analyzer._run_analysis_batches(analyzer.image_paths, None, 15, 100, 2, aggregator)
+    assert aggregator.duplicates == [(copy, original)]
+    assert analyzer.encoded_images == 1 and analyzer.color_extractor.calls == 1
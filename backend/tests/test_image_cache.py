@@ -0,0 +1,42 @@
+# test_image_cache.py - Base SQLite du cache d'analyse par image et reprise de l'ancien format
+import os
+import json
+import numpy as np
+
+from image_cache import ImageAnalysisCache
+
+EMBEDDING_DIM = 8
+COLOR = {'rgb': [10.0, 20.0, 30.0], 'hex': '#0a141e', 'proportion': 1.0, 'pantone_ref': 'P'}
+
+
+def test_entries_survive_a_new_instance(tmp_path):
+    image_cache = ImageAnalysisCache(str(tmp_path), 'ViT-B/32', 15, 100, EMBEDDING_DIM)
+    assert 'a' * 64 not in image_cache and not os.path.exists(image_cache.directory)
+    image_cache.put('a' * 64, np.ones(EMBEDDING_DIM), [{**COLOR, 'proportion': np.float64(0.5)}])
+    assert 'a' * 64 in image_cache
+    image_cache.flush()
+    image_cache.put('a' * 64, np.zeros(EMBEDDING_DIM), [])
+    image_cache.flush()
+
+    image_cache = ImageAnalysisCache(str(tmp_path), 'ViT-B/32', 15, 100, EMBEDDING_DIM)
+    assert len(image_cache) == 1
+    embedding, colors = image_cache.get('a' * 64)
+    # La première entrée écrite est gardée
+    assert np.array_equal(embedding, np.ones(EMBEDDING_DIM)) and colors == [{**COLOR, 'proportion': 0.5}]
+    assert image_cache.get('b' * 64) is None
+
+
+def test_legacy_index_is_imported_once(tmp_path):
+    image_cache = ImageAnalysisCache(str(tmp_path), 'ViT-B/32', 15, 100, EMBEDDING_DIM)
+    # Ancien format : index JSON de toutes les entrées + fichier float32 des embeddings
+    directory = tmp_path / 'image_analysis' / os.path.basename(image_cache.directory)
+    directory.mkdir(parents=True)
+    embeddings = np.arange(2 * EMBEDDING_DIM, dtype=np.float32).reshape(2, EMBEDDING_DIM)
+    embeddings.tofile(directory / 'embeddings.f32')
+    (directory / 'index.json').write_text(json.dumps({'entries': {'a' * 64: {'row': 0, 'colors': [COLOR]}, 'b' * 64: {'row': 1, 'colors': []}}}))
+
+    assert len(image_cache) == 2
+    embedding, colors = image_cache.get('b' * 64)
+    assert np.array_equal(embedding, embeddings[1]) and colors == []
+    assert not (directory / 'index.json').exists() and not (directory / 'embeddings.f32').exists()
+    assert ImageAnalysisCache(str(tmp_path), 'ViT-B/32', 15, 100, EMBEDDING_DIM).get('a' * 64)[1] == [COLOR]
@@ -0,0 +1,50 @@
+# test_image_selection.py - Lecture des srcset et choix de l'URL à télécharger pour chaque <img> du scraper
+import pytest
+
+pytest.importorskip("selenium")
+from bucket import parse_srcset, width_from_sizes, select_image_url, select_image_urls
+
+BASE_URL = 'https://www.tag-walk.com/en/collection/woman/chanel/spring-summer-2025'
+CDN = 'https://cdn.tag-walk.com/image/upload'
+
+
+def test_parse_srcset_descriptors():
+    assert parse_srcset('a.jpg 640w, b.jpg 1280w') == [('a.jpg', 'w', 640), ('b.jpg', 'w', 1280)]
+    assert parse_srcset('a.jpg 1x,b.jpg 2.5x') == [('a.jpg', 'x', 1.0), ('b.jpg', 'x', 2.5)]
+    # Sans descripteur : 1x ; descripteur illisible : candidat ignoré
+    assert parse_srcset('a.jpg, b.jpg 2x, c.jpg big') == [('a.jpg', 'x', 1.0), ('b.jpg', 'x', 2.0)]
+    assert parse_srcset('') == [] and parse_srcset(None) == []
+
+
+def test_parse_srcset_keeps_commas_inside_urls():
+    srcset = f"{CDN}/w_640,c_fill,q_80/look1.jpg 640w,\n  {CDN}/w_1280,c_fill,q_80/look1.jpg 1280w"
+    assert parse_srcset(srcset) == [(f"{CDN}/w_640,c_fill,q_80/look1.jpg", 'w', 640), (f"{CDN}/w_1280,c_fill,q_80/look1.jpg", 'w', 1280)]
+
+
+def test_width_from_sizes():
+    assert width_from_sizes('(max-width: 600px) 100vw, 400px') == 400
+    assert width_from_sizes('(max-width: 600px) 100vw, 50vw') == 640
+    assert width_from_sizes('auto') == 0 and width_from_sizes('') == 0
+
+
+def test_select_image_url():
+    srcset = 'a_480.jpg 480w, a_800.jpg 800w, a_1600.jpg 1600w'
+    # La plus petite variante d'au moins target_width pixels, résolue par rapport à la page
+    assert select_image_url({'srcset': srcset, 'width': 300, 'height': 450}, BASE_URL) == 'https://www.tag-walk.com/en/collection/woman/chanel/a_800.jpg'
+    # Aucune assez large : la plus large
+    assert select_image_url({'srcset': srcset}, BASE_URL, target_width=2000).endswith('/a_1600.jpg')
+    # Densités : largeur = emplacement x densité
+    assert select_image_url({'srcset': 'b.jpg 1x, b@2x.jpg 2x', 'width': 400, 'height': 600}, BASE_URL).endswith('/b@2x.jpg')
+    assert select_image_url({'srcset': 'b.jpg 1x, b@2x.jpg 2x', 'sizes': '800px'}, BASE_URL).endswith('/b.jpg')
+    # Sans srcset : src ; sans URL : None
+    assert select_image_url({'src': '/img/look.jpg'}, BASE_URL) == 'https://www.tag-walk.com/img/look.jpg'
+    assert select_image_url({'src': ''}, BASE_URL) is None
+    # Icônes et pixels de suivi (rendus trop petits) : ignorés ; taille inconnue : gardée
+    assert select_image_url({'src': 'logo.png', 'width': 120, 'height': 40}, BASE_URL) is None
+    assert select_image_url({'src': 'look.jpg', 'width': 0, 'height': 0}, BASE_URL) is not None
+
+
+def test_select_image_urls_keeps_first_occurrence_of_each_file():
+    images = [{'src': 'logo.png', 'width': 100, 'height': 30}, {'src': '/looks/1.jpg'}, {'src': '/looks/2.jpg'},
+              {'src': 'https://www.tag-walk.com/looks/1.jpg'}, {'src': 'data:image/gif;base64,R0lGOD'}, {'src': '/looks/3.jpg'}]
+    assert select_image_urls(images, BASE_URL) == [(1, 'https://www.tag-walk.com/looks/1.jpg'), (2, 'https://www.tag-walk.com/looks/2.jpg'), (5, 'https://www.tag-walk.com/looks/3.jpg')]
@@ -0,0 +1,35 @@
+# test_pantone_index.py - Le KD-tree Lab donne la même couleur Pantone que l'argmin Delta E CIE76 d'origine
+import numpy as np
+import pytest
+
+pytest.importorskip("skimage")
+pytest.importorskip("scipy")
+from skimage.color import rgb2lab, deltaE_cie76
+
+from pantone_index import PantoneIndex
+
+
+def test_query_matches_exhaustive_cie76_argmin(tmp_path):
+    index = PantoneIndex.build()
+    rng = np.random.default_rng(5)
+    # Couleurs entières, couleurs flottantes (tronquées comme à l'origine) et couleurs exactes de la bibliothèque
+    library_rgb = [[int(hex_code[i:i + 2], 16) for i in (1, 3, 5)] for hex_code in index.hexes]
+    rgb_colors = np.concatenate([rng.integers(0, 256, (2000, 3)), rng.uniform(0, 255, (1000, 3)), library_rgb]).astype(np.float64)
+
+    # _find_best_pantone_match d'origine : Delta E CIE76 vers toute la bibliothèque, premier minimum
+    input_labs = rgb2lab(rgb_colors.astype(np.uint8).reshape(-1, 1, 3)).reshape(-1, 3)
+    distances = np.stack([deltaE_cie76(lab, index.labs) for lab in input_labs])
+    expected = distances.argmin(axis=1)
+
+    indices = index.query(rgb_colors)
+    rows = np.arange(len(rgb_colors))
+    np.testing.assert_allclose(distances[rows, indices], distances[rows, expected], rtol=0, atol=1e-9)
+    # Hors égalités exactes (une teinte en double dans la bibliothèque), c'est la même couleur
+    unique_minimum = (distances == distances[rows, expected][:, None]).sum(axis=1) == 1
+    assert np.array_equal(indices[unique_minimum], expected[unique_minimum])
+
+    # L'artefact précompilé donne les mêmes correspondances
+    artifact_path = str(tmp_path / 'pantone.npz')
+    index.save(artifact_path)
+    reloaded = PantoneIndex.load(str(tmp_path / 'missing.json'), artifact_path)
+    assert reloaded.match_many(rgb_colors[:50]) == [(index.names[i], index.hexes[i]) for i in indices[:50]]
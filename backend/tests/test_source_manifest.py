@@ -0,0 +1,30 @@
+# test_source_manifest.py - Reprise des quasi-doublons mémorisés dans le manifest ETag
+from source_manifest import SourceManifest
+
+SOURCE = 's3://trendsproject/images/tagwalk/collection'
+
+
+def saved_manifest(tmp_path, current_etags):
+    manifest = SourceManifest(str(tmp_path), SOURCE, {'model': 'ViT-B/32'})
+    manifest.update('s3://b/original.jpg', current_etags['s3://b/original.jpg'], {'garment_scores': [], 'style_scores': []}, [])
+    manifest.mark_duplicate('s3://b/copy.jpg', current_etags['s3://b/copy.jpg'], 's3://b/original.jpg', current_etags['s3://b/original.jpg'])
+    manifest.save(current_etags)
+    return SourceManifest(str(tmp_path), SOURCE, {'model': 'ViT-B/32'})
+
+
+def test_duplicate_reused_while_original_unchanged(tmp_path):
+    etags = {'s3://b/original.jpg': '"a"', 's3://b/copy.jpg': '"b"'}
+    manifest = saved_manifest(tmp_path, etags)
+    assert manifest.duplicate_of('s3://b/copy.jpg', '"b"', etags) == 's3://b/original.jpg'
+    assert manifest.lookup('s3://b/copy.jpg', '"b"') is None
+
+
+def test_duplicate_reanalyzed_when_original_removed_or_changed(tmp_path):
+    etags = {'s3://b/original.jpg': '"a"', 's3://b/copy.jpg': '"b"'}
+    manifest = saved_manifest(tmp_path, etags)
+    # Original supprimé de la source entre deux analyses : le manifest n'a pas encore été élagué
+    assert manifest.duplicate_of('s3://b/copy.jpg', '"b"', {'s3://b/copy.jpg': '"b"'}) is None
+    # Original remplacé (nouvel ETag)
+    assert manifest.duplicate_of('s3://b/copy.jpg', '"b"', {**etags, 's3://b/original.jpg': '"c"'}) is None
+    # Doublon lui-même modifié
+    assert manifest.duplicate_of('s3://b/copy.jpg', '"d"', etags) is None
@@ -0,0 +1,156 @@
+# test_trend_aggregator.py - L'agrégation en colonnes reproduit l'agrégation d'origine (objets couleur en listes)
+import math
+import random
+import colorsys
+from collections import Counter
+import numpy as np
+from sklearn.cluster import KMeans
+
+from trend_aggregator import TrendAggregator
+
+# Gammes qui se chevauchent, avec un trou (250-260°) et une gamme qui passe par 360°/0°
+COLOR_RANGES = [(300, 20, 'Red', '#D12631', 'P-red'), (20, 30, 'Coral', '#FF6F61', 'P-coral'), (30, 100, 'Amber', '#D78A41', 'P-amber'),
+                (100, 250, 'Green & Blue', '#00A170', 'P-green'), (200, 300, 'Blue & Violet', '#0047AB', 'P-blue'), (260, 280, 'Lilac', '#B69FCB', 'P-lilac')]
+GARMENTS = ['dress', 'coat', 'skirt', 'blazer', 'jeans']
+CHANNEL_LEVELS = [10.0, 60.0, 120.0, 200.0, 250.0]
+
+
+def match_pantone(rgb_colors):
+    """Pantone factice, déterministe : nom et hex dépendent du canal rouge."""
+    return [(f"P{int(rgb[0]) // 40}", f"#{int(rgb[0]) // 40:02x}{int(rgb[1]) // 64:02x}00") for rgb in rgb_colors]
+
+
+def synthetic_images(n_images, seed):
+    """Images aléatoires reproductibles : scores de vêtements triés, un style, 0 à 5 couleurs (dont des teintes absentes)."""
+    rng = random.Random(seed)
+    images = []
+    for i_image in range(n_images):
+        weights = np.array([rng.random() for _ in GARMENTS])
+        garment_scores = sorted(zip(GARMENTS, (weights / weights.sum()).tolist()), key=lambda item: item[1], reverse=True)
+        style_scores = [(f"style-{rng.randint(0, 3)}", 0.9), ('other', 0.1)]
+        colors = []
+        for _ in range(rng.randint(0, 5)):
+            rgb = [rng.choice(CHANNEL_LEVELS) + rng.choice([0.0, 0.5]) for _ in range(3)]
+            h, s, v = colorsys.rgb_to_hsv(*(c / 255.0 for c in rgb))
+            pantone_name, hex_color = match_pantone([rgb])[0]
+            # Saturation et luminosité arrondies : beaucoup d'égalités pour le choix des couleurs représentatives
+            colors.append({'rgb': rgb, 'hex': hex_color, 'hue': None if rng.random() < 0.05 else h * 360, 'saturation': round(s * 10) * 10.0, 'value': round(v * 10) * 10.0,
+                           'brightness': float(np.mean(rgb)), 'color_complexity': float(np.std(rgb)), 'proportion': rng.random(), 'pantone_ref': pantone_name, 'color_name': pantone_name})
+        images.append((f"look_{i_image}.jpg", {'garment_scores': garment_scores, 'style_scores': style_scores}, colors))
+    return images
+
+
+def baseline_color_distribution(color_objects, color_array):
+    """FashionTrendColorAnalyzer._analyze_fashion_color_distribution d'origine."""
+    if not color_objects: return {}
+    full_analysis = {'color_range_distribution': {}, 'color_metrics': {}, 'pantone_distribution': {}, 'dominant_colors': []}
+    for start, end, name, hex_color, pantone_code in COLOR_RANGES:
+        if start > end: in_range = [c for c in color_objects if c.get('hue') is not None and (c['hue'] >= start or c['hue'] < end)]
+        else: in_range = [c for c in color_objects if c.get('hue') is not None and start <= c['hue'] < end]
+        if not in_range: continue
+        full_analysis['color_range_distribution'][name] = {'count': len(in_range), 'percentage': len(in_range) / len(color_objects) * 100, 'representative_colors': [c['hex'] for c in sorted(in_range, key=lambda x: x.get('saturation', 0) * x.get('value', 0), reverse=True)[:3]], 'pantone_ref': pantone_code, 'primary_color': hex_color}
+    pantone_counts = Counter(c['pantone_ref'] for c in color_objects)
+    for pantone, count in pantone_counts.most_common(10):
+        if matching_colors := [c for c in color_objects if c['pantone_ref'] == pantone]: full_analysis['pantone_distribution'][pantone] = {'count': count, 'percentage': count / len(color_objects) * 100, 'representative_color': matching_colors[0]['hex']}
+    if color_array.size > 0:
+        n_dominant = min(10, len(np.unique(color_array, axis=0)))
+        if n_dominant > 0:
+            kmeans = KMeans(n_clusters=n_dominant, n_init='auto', random_state=0).fit(color_array)
+            percentages = (np.bincount(kmeans.labels_) / len(kmeans.labels_)) * 100
+            dominant_colors_list = []
+            for i_color, color in enumerate(kmeans.cluster_centers_):
+                if i_color < len(percentages):
+                    pantone_name, hex_color = match_pantone([color])[0]
+                    dominant_colors_list.append({'rgb': [int(c) for c in color], 'hex': hex_color, 'pantone_ref': pantone_name, 'color_name': pantone_name, 'percentage': percentages[i_color]})
+            full_analysis['dominant_colors'] = sorted(dominant_colors_list, key=lambda x: x['percentage'], reverse=True)
+    unique_hex = set(c['hex'] for c in color_objects)
+    full_analysis['color_metrics'] = {'total_unique_colors': len(unique_hex), 'average_saturation': np.mean([c.get('saturation', 0) for c in color_objects]), 'average_brightness': np.mean([c.get('value', 0) for c in color_objects]), 'color_diversity_index': len(unique_hex) / len(color_objects)}
+    return full_analysis
+
+
+def baseline_report(images, confidence_threshold):
+    """Fin d'analyze_fashion_trends d'origine : compteurs, distribution des couleurs et couleurs par vêtement (bins RGB de 25)."""
+    all_colors, all_color_objects, all_garment_types, all_style_types, image_analysis_results = [], [], [], [], []
+    for image_source, analysis_results, image_colors in images:
+        found_garments_with_scores = []
+        for category, score in analysis_results['garment_scores']:
+            if score > confidence_threshold:
+                all_garment_types.append(category)
+                found_garments_with_scores.append((category, score))
+            else: break
+        if not found_garments_with_scores:
+            all_garment_types.append(analysis_results['garment_scores'][0][0])
+            found_garments_with_scores.append(analysis_results['garment_scores'][0])
+        all_style_types.append(analysis_results['style_scores'][0][0])
+        for color in image_colors:
+            all_colors.append(np.array(color['rgb']))
+            all_color_objects.append(color)
+        image_analysis_results.append({'source': image_source, 'garment_analysis': analysis_results, 'colors': image_colors, 'found_garments_with_scores': found_garments_with_scores})
+
+    color_garment_correlations = {}
+    for result in image_analysis_results:
+        for garment, _ in result['found_garments_with_scores']:
+            color_garment_correlations.setdefault(garment, []).extend(result['colors'])
+    garment_color_trends = {}
+    for garment, colors in color_garment_correlations.items():
+        if not colors: continue
+        color_bins = {}
+        for color in colors:
+            color_bins.setdefault(tuple(int(c / 25) * 25 for c in color['rgb']), []).append(color)
+        binned_colors = []
+        for bin_colors in color_bins.values():
+            rep_color = bin_colors[0].copy()
+            rep_color['rgb'] = np.mean([c['rgb'] for c in bin_colors], axis=0)
+            pantone_name, hex_color = match_pantone([rep_color['rgb']])[0]
+            rep_color['hex'], rep_color['pantone_ref'], rep_color['color_name'] = hex_color, pantone_name, pantone_name
+            rep_color['frequency'] = sum(c['proportion'] for c in bin_colors) * 100
+            binned_colors.append(rep_color)
+        garment_color_trends[garment] = sorted(binned_colors, key=lambda x: x['frequency'], reverse=True)
+
+    return {
+        'color_trends': baseline_color_distribution(all_color_objects, np.array(all_colors) if all_colors else np.array([])),
+        'garment_trends': {'distribution': {g: {'count': c} for g, c in Counter(all_garment_types).most_common()}},
+        'style_trends': {'distribution': {s: {'count': c} for s, c in Counter(all_style_types).most_common()}},
+        'color_garment_trends': garment_color_trends,
+        'detailed_image_analysis': image_analysis_results,
+    }
+
+
+def assert_same(expected, actual, path='report'):
+    """Égalité récursive, ordre des clés compris ; les flottants (et tableaux NumPy) à 1e-9 près."""
+    if isinstance(expected, dict):
+        assert list(actual) == list(expected), path
+        for key in expected: assert_same(expected[key], actual[key], f"{path}/{key}")
+    elif isinstance(expected, (list, tuple, np.ndarray)):
+        assert len(actual) == len(expected), path
+        for i, (e, a) in enumerate(zip(expected, actual)): assert_same(e, a, f"{path}[{i}]")
+    elif isinstance(expected, (float, np.floating)):
+        assert math.isclose(float(actual), float(expected), rel_tol=1e-9, abs_tol=1e-9), (path, expected, actual)
+    else:
+        assert actual == expected, (path, expected, actual)
+
+
+def test_report_matches_baseline_aggregation():
+    images = synthetic_images(400, seed=3)
+    aggregator = TrendAggregator(COLOR_RANGES, match_pantone, 0.25)
+    for image in images: aggregator.add_image(*image)
+    report, all_detected = aggregator.report()
+    expected = baseline_report(images, 0.25)
+
+    assert report.pop('deduplication') == {'duplicates_removed': 0, 'duplicates': []}
+    assert_same(expected, report)
+    assert all_detected == [item for result in expected['detailed_image_analysis'] for item in result['found_garments_with_scores']]
+
+
+def test_partial_report_matches_baseline_on_images_so_far():
+    images = synthetic_images(120, seed=11)
+    aggregator = TrendAggregator(COLOR_RANGES, match_pantone, 0.25)
+    for i_image, image in enumerate(images, start=1):
+        aggregator.add_image(*image)
+        if i_image in (1, 37, 120):
+            # Les rapports partiels sont calculés sur les colonnes déjà concaténées, puis complétées
+            report, _ = aggregator.report(include_details=False)
+            expected = baseline_report(images[:i_image], 0.25)
+            expected['detailed_image_analysis'] = []
+            report.pop('deduplication')
+            assert_same(expected, report, f"report@{i_image}")
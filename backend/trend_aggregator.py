@@ -0,0 +1,219 @@
+# trend_aggregator.py - Agrégation incrémentale des résultats d'analyse image par image
+from collections import Counter
+import numpy as np
+
+# Colonnes numériques d'une couleur (une ligne par cluster de couleur)
+COLOR_COLUMNS = ('hue', 'saturation', 'value', 'brightness', 'color_complexity', 'proportion')
+# Nombre maximal de couleurs utilisées par le KMeans des couleurs dominantes d'un rapport partiel
+PARTIAL_DOMINANT_SAMPLE = 5000
+
+
+class TrendAggregator:
+    """
+    Met à jour les compteurs vêtements/styles à chaque image terminée et stocke les couleurs en colonnes
+    NumPy (RGB, teinte, saturation, luminosité, proportion, identifiants Pantone/hex) ; les statistiques
+    de couleurs sont calculées par réductions groupées sur ces colonnes. Aucun objet couleur n'est gardé
+    en dehors du détail par image (keep_details) ; les colonnes, elles, croissent avec le nombre d'images.
+    report() peut être appelé à tout moment (résultats partiels) et produit le même dictionnaire
+    que l'ancienne agrégation de fin d'analyse.
+    Avec detail_top_k, le détail par image ne garde que les top_k scores vêtements et styles
+    (les compteurs sont toujours calculés sur la liste complète).
+    """
+    def __init__(self, fashion_color_ranges, match_pantone, confidence_threshold, keep_details=True, detail_top_k=None):
+        self.fashion_color_ranges = fashion_color_ranges
+        self.match_pantone = match_pantone
+        self.confidence_threshold = confidence_threshold
+        self.keep_details = keep_details
+        self.detail_top_k = detail_top_k
+        self.image_analysis_results = []
+        self.all_detected_garments_with_scores = []
+        self.garment_counts = Counter()
+        self.style_counts = Counter()
+        # Quasi-doublons écartés avant l'analyse : (source, source de l'image retenue)
+        self.duplicates = []
+        # Couleurs en colonnes, accumulées par morceaux (un morceau par image) et concaténées à la demande
+        self.n_colors = 0
+        self._chunks = {column: [] for column in ('rgb', 'pantone', 'hex') + COLOR_COLUMNS}
+        self._table = None
+        # Identifiants attribués dans l'ordre de première apparition
+        self._pantone_ids, self._hex_ids = {}, {}
+        # vêtement -> intervalles [début, fin) des lignes de couleurs des images où il est détecté
+        self._garment_rows = {}
+        self._hue_bins = self._build_hue_bins(fashion_color_ranges)
+
+    @staticmethod
+    def _build_hue_bins(fashion_color_ranges):
+        """
+        Découpe l'axe des teintes sur les bornes de toutes les gammes : chaque gamme (y compris celles
+        qui passent par 360°/0°) est une union de bins, ce qui permet de tout compter en un seul histogramme.
+        Retourne (bornes, matrice gammes x bins) ; le dernier bin reçoit les couleurs sans teinte.
+        """
+        edges = np.unique([bound for start, end, *_ in fashion_color_ranges for bound in (start, end)]).astype(np.float64)
+        lower = np.concatenate([[-np.inf], edges])
+        upper = np.concatenate([edges, [np.inf]])
+        membership = np.zeros((len(fashion_color_ranges), len(edges) + 2), dtype=bool)
+        for i_range, (start, end, *_) in enumerate(fashion_color_ranges):
+            membership[i_range, :-1] = ((lower >= start) | (upper <= end)) if start > end else ((lower >= start) & (upper <= end))
+        return edges, membership
+
+    def add_image(self, image_source, analysis_results, image_colors):
+        garment_scores = analysis_results['garment_scores']
+        style_scores = analysis_results['style_scores']
+
+        found_garments_with_scores = []
+        for category, score in garment_scores:
+            if score > self.confidence_threshold:
+                found_garments_with_scores.append((category, score))
+            else: break
+
+        if not found_garments_with_scores and garment_scores:
+            found_garments_with_scores.append(garment_scores[0])
+
+        self.garment_counts.update(category for category, _ in found_garments_with_scores)
+        self.all_detected_garments_with_scores.extend(found_garments_with_scores)
+        if style_scores:
+            self.style_counts[style_scores[0][0]] += 1
+
+        first_row = self.n_colors
+        self._add_colors(image_colors)
+        for garment, _ in found_garments_with_scores:
+            garment_rows = self._garment_rows.setdefault(garment, [])
+            if image_colors: garment_rows.append((first_row, self.n_colors))
+
+        if self.keep_details:
+            if self.detail_top_k:
+                analysis_results = {**analysis_results, 'garment_scores': garment_scores[:self.detail_top_k], 'style_scores': style_scores[:self.detail_top_k]}
+            self.image_analysis_results.append({'source': image_source, 'garment_analysis': analysis_results, 'colors': image_colors, 'found_garments_with_scores': found_garments_with_scores})
+        return found_garments_with_scores
+
+    def add_duplicate(self, image_source, duplicate_of):
+        self.duplicates.append((image_source, duplicate_of))
+
+    def _add_colors(self, image_colors):
+        if not image_colors: return
+        chunks = self._chunks
+        chunks['rgb'].append(np.array([c['rgb'] for c in image_colors], dtype=np.float64).reshape(-1, 3))
+        chunks['hue'].append(np.array([np.nan if c.get('hue') is None else c['hue'] for c in image_colors], dtype=np.float64))
+        chunks['saturation'].append(np.array([c.get('saturation', 0) for c in image_colors], dtype=np.float64))
+        chunks['value'].append(np.array([c.get('value', 0) for c in image_colors], dtype=np.float64))
+        chunks['brightness'].append(np.array([c['brightness'] if 'brightness' in c else np.mean(c['rgb']) for c in image_colors], dtype=np.float64))
+        chunks['color_complexity'].append(np.array([c['color_complexity'] if 'color_complexity' in c else np.std(c['rgb']) for c in image_colors], dtype=np.float64))
+        chunks['proportion'].append(np.array([c.get('proportion', 0) for c in image_colors], dtype=np.float64))
+        chunks['pantone'].append(np.array([self._pantone_ids.setdefault(c['pantone_ref'], len(self._pantone_ids)) for c in image_colors], dtype=np.int64))
+        chunks['hex'].append(np.array([self._hex_ids.setdefault(c['hex'], len(self._hex_ids)) for c in image_colors], dtype=np.int64))
+        self.n_colors += len(image_colors)
+        self._table = None
+
+    def _color_table(self):
+        if self._table is None:
+            self._table = {column: np.concatenate(chunks) for column, chunks in self._chunks.items()}
+            # Un seul morceau par colonne : les rapports suivants n'ont que les nouvelles images à concaténer
+            for column, values in self._table.items(): self._chunks[column] = [values]
+        return self._table
+
+    def _color_distribution(self, dominant_sample=None):
+        if not self.n_colors: return {}
+        table = self._color_table()
+        full_analysis = {'color_range_distribution': {}, 'color_metrics': {}, 'pantone_distribution': {}, 'dominant_colors': []}
+        hex_names = list(self._hex_ids)
+
+        # Histogramme des teintes, puis effectif de chaque gamme = somme de ses bins
+        edges, membership = self._hue_bins
+        hue = table['hue']
+        hue_bins = np.where(np.isnan(hue), membership.shape[1] - 1, np.searchsorted(edges, hue, side='right'))
+        range_counts = membership.astype(np.int64) @ np.bincount(hue_bins, minlength=membership.shape[1])
+
+        # Couleurs classées par saturation x luminosité décroissante (à égalité, la première rencontrée),
+        # regroupées par bin : les 3 premières de chaque bin sont les candidates de leurs gammes
+        score = table['saturation'] * table['value']
+        ranked = np.argsort(-score, kind='stable')
+        ranked = ranked[np.argsort(hue_bins[ranked], kind='stable')]
+        bin_starts = np.searchsorted(hue_bins[ranked], np.arange(membership.shape[1] + 1))
+
+        for i_range, (start, end, name, hex_color, pantone_code) in enumerate(self.fashion_color_ranges):
+            count = int(range_counts[i_range])
+            if not count: continue
+            candidates = np.concatenate([ranked[bin_starts[b]:min(bin_starts[b] + 3, bin_starts[b + 1])] for b in np.flatnonzero(membership[i_range])])
+            top = candidates[np.lexsort((candidates, -score[candidates]))[:3]]
+            representative_colors = [hex_names[i] for i in table['hex'][top]]
+            full_analysis['color_range_distribution'][name] = {'count': count, 'percentage': count / self.n_colors * 100, 'representative_colors': representative_colors, 'pantone_ref': pantone_code, 'primary_color': hex_color}
+
+        # Les identifiants Pantone suivent l'ordre de première apparition : un tri stable reproduit most_common
+        pantone_names = list(self._pantone_ids)
+        pantone_counts = np.bincount(table['pantone'], minlength=len(pantone_names))
+        _, pantone_first_rows = np.unique(table['pantone'], return_index=True)
+        for i_pantone in np.argsort(-pantone_counts, kind='stable')[:10]:
+            count = int(pantone_counts[i_pantone])
+            full_analysis['pantone_distribution'][pantone_names[i_pantone]] = {'count': count, 'percentage': count / self.n_colors * 100, 'representative_color': hex_names[table['hex'][pantone_first_rows[i_pantone]]]}
+
+        color_array = table['rgb']
+        if dominant_sample and len(color_array) > dominant_sample:
+            # Rapport partiel : couleurs dominantes estimées sur un échantillon (reproductible) des couleurs
+            sample_rows = np.sort(np.random.default_rng(0).choice(len(color_array), dominant_sample, replace=False))
+            color_array = color_array[sample_rows]
+        # Nombre de couleurs RGB distinctes, via une vue 1D des lignes (évite np.unique(axis=0))
+        n_unique = len(np.unique(np.ascontiguousarray(color_array).view(np.dtype((np.void, color_array.dtype.itemsize * 3)))))
+        n_dominant = min(10, n_unique)
+        if n_dominant > 0:
+            from sklearn.cluster import KMeans
+            kmeans = KMeans(n_clusters=n_dominant, n_init='auto', random_state=0).fit(color_array)
+            label_counts = np.bincount(kmeans.labels_)
+            percentages = (label_counts / len(kmeans.labels_)) * 100
+            centers = kmeans.cluster_centers_[:len(percentages)]
+            dominant_colors_list = []
+            for i_color, (color, (pantone_name, hex_color)) in enumerate(zip(centers, self.match_pantone(centers))):
+                dominant_colors_list.append({'rgb': [int(c) for c in color], 'hex': hex_color, 'pantone_ref': pantone_name, 'color_name': pantone_name, 'percentage': percentages[i_color]})
+            full_analysis['dominant_colors'] = sorted(dominant_colors_list, key=lambda x: x['percentage'], reverse=True)
+        full_analysis['color_metrics'] = {'total_unique_colors': len(hex_names), 'average_saturation': float(table['saturation'].mean()), 'average_brightness': float(table['value'].mean()), 'color_diversity_index': len(hex_names) / self.n_colors}
+        return full_analysis
+
+    def _garment_color_trends(self):
+        if not self.n_colors: return {}
+        table = self._color_table()
+        garment_color_trends = {}
+        for garment, row_ranges in self._garment_rows.items():
+            if not row_ranges: continue
+            rows = np.concatenate([np.arange(first, last) for first, last in row_ranges])
+            rgb = table['rgb'][rows]
+            # Bins RGB de 25 unités, encodés en une seule clé entière par couleur
+            quantized = (rgb / 25).astype(np.int64)
+            quantized -= quantized.min(axis=0)
+            base = int(quantized.max()) + 1
+            keys = (quantized[:, 0] * base + quantized[:, 1]) * base + quantized[:, 2]
+            _, bin_first, bin_index = np.unique(keys, return_index=True, return_inverse=True)
+            bin_counts = np.bincount(bin_index)
+            mean_rgb = np.stack([np.bincount(bin_index, weights=rgb[:, channel]) for channel in range(3)], axis=1) / bin_counts[:, None]
+            proportion_sums = np.bincount(bin_index, weights=table['proportion'][rows])
+            # Bins dans l'ordre de première apparition, comme l'ancien dictionnaire
+            bin_order = np.argsort(bin_first, kind='stable')
+
+            binned_colors = []
+            # Une seule requête Pantone pour tous les bins du vêtement
+            for i_bin, (pantone_name, hex_color) in zip(bin_order, self.match_pantone(mean_rgb[bin_order])):
+                # Couleur représentative : la première du bin, reconstruite depuis les colonnes
+                row = rows[bin_first[i_bin]]
+                hue = table['hue'][row]
+                binned_colors.append({
+                    'rgb': mean_rgb[i_bin], 'hex': hex_color, 'hue': None if np.isnan(hue) else hue,
+                    **{column: table[column][row] for column in COLOR_COLUMNS if column != 'hue'},
+                    'pantone_ref': pantone_name, 'color_name': pantone_name, 'frequency': proportion_sums[i_bin] * 100,
+                })
+            garment_color_trends[garment] = sorted(binned_colors, key=lambda x: x['frequency'], reverse=True)
+        return garment_color_trends
+
+    def report(self, include_details=True, dominant_sample=None):
+        """
+        Retourne (fashion_trends_dict, all_detected_garments_with_scores), ou (None, None) sans données.
+        dominant_sample borne le nombre de couleurs passées au KMeans des couleurs dominantes (rapports partiels).
+        """
+        if not self.garment_counts:
+            return None, None
+        fashion_trends_dict = {
+            'color_trends': self._color_distribution(dominant_sample),
+            'garment_trends': {'distribution': {g: {'count': c} for g, c in self.garment_counts.most_common()}},
+            'style_trends': {'distribution': {s: {'count': c} for s, c in self.style_counts.most_common()}},
+            'color_garment_trends': self._garment_color_trends(),
+            'deduplication': {'duplicates_removed': len(self.duplicates), 'duplicates': [{'source': source, 'duplicate_of': original} for source, original in self.duplicates]},
+            'detailed_image_analysis': self.image_analysis_results if include_details else []
+        }
+        return fashion_trends_dict, self.all_detected_garments_with_scores